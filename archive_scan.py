@@ -0,0 +1,190 @@
+import argparse
+import glob
+import json
+import os
+import sqlite3
+from collections import deque
+from contextlib import closing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+from snapshot_archive import SnapshotArchive, is_archive
+from snapshot_store import DATA_DIR, load_snapshot
+
+# Snapshots from before the current data folder was started
+OLD_DATA_DIR = os.getenv("ZALENIA_OLD_DATA_DIR", "D:/ZaleniaData.OLD")
+# Facts extracted per file, reused while the file's size and mtime are unchanged
+SCAN_CACHE = f"{DATA_DIR}/scan_cache.db"
+SCAN_WORKERS = int(os.getenv("SCAN_WORKERS", str(os.cpu_count() or 2)))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS facts (
+    extractor TEXT NOT NULL,
+    path TEXT NOT NULL,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    facts TEXT NOT NULL,
+    PRIMARY KEY (extractor, path)
+) WITHOUT ROWID;
+"""
+
+
+class ScanCache:
+    def __init__(self, extractor, db_file=SCAN_CACHE):
+        self.extractor = extractor
+        os.makedirs(os.path.dirname(db_file) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(db_file, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._conn.commit()
+        self._conn.close()
+
+    def get(self, path, stat):
+        row = self._conn.execute(
+            "SELECT mtime, size, facts FROM facts WHERE extractor = ? AND path = ?",
+            (self.extractor, path),
+        ).fetchone()
+        if row is None or row[0] != stat.st_mtime or row[1] != stat.st_size:
+            return None
+        return json.loads(row[2])
+
+    def put(self, path, stat, facts):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO facts VALUES (?, ?, ?, ?, ?)",
+            (self.extractor, path, stat.st_mtime, stat.st_size, json.dumps(facts)),
+        )
+
+
+def scan(paths, extract, cache=None, workers=SCAN_WORKERS):
+    # Yields (path, mtime, facts) in the order of paths. extract(path) runs in
+    # a process pool, a few files ahead of the consumer; breaking out of the
+    # loop cancels whatever hasn't started yet.
+    window = workers * 4
+    executor = None
+    queue = deque()  # (path, stat, future or None, facts)
+    in_flight = 0
+    paths = iter(paths)
+    try:
+        while True:
+            while in_flight < window:
+                path = next(paths, None)
+                if path is None:
+                    break
+                stat = os.stat(path)
+                facts = cache.get(path, stat) if cache is not None else None
+                if facts is not None:
+                    queue.append((path, stat, None, facts))
+                    continue
+                if executor is None:
+                    executor = ProcessPoolExecutor(max_workers=workers)
+                queue.append((path, stat, executor.submit(extract, path), None))
+                in_flight += 1
+
+            if not queue:
+                return
+            path, stat, future, facts = queue.popleft()
+            if future is not None:
+                in_flight -= 1
+                facts = future.result()
+                if cache is not None:
+                    cache.put(path, stat, facts)
+            yield path, stat.st_mtime, facts
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def continent_cities(path):
+    # {"continents": {continent id: city count}} for one WorldData snapshot
+    if is_archive(path):
+        # Two small columns instead of the raw JSON
+        with SnapshotArchive(path) as archive:
+            columns = archive.read_columns(["continents", "continent"])
+        counts = np.bincount(columns["continent"], minlength=len(columns["continents"]))
+        return {
+            "continents": {
+                str(cont_id): int(count)
+                for cont_id, count in zip(columns["continents"], counts)
+            }
+        }
+
+    world_data = load_snapshot(path)
+    # Some old snapshots were pickled JSON strings
+    if isinstance(world_data, str):
+        try:
+            world_data = json.loads(world_data)
+        except json.JSONDecodeError:
+            return {"invalid": "Invalid JSON"}
+    if not isinstance(world_data, dict) or "continents" not in world_data:
+        return {"invalid": "Invalid data format"}
+    return {
+        "continents": {
+            str(continent["continentIdentifier"]): len(continent["cities"])
+            for continent in world_data["continents"]
+        }
+    }
+
+
+def snapshot_files(folders):
+    # Every snapshot in the folders, oldest first
+    paths = [
+        path
+        for folder in folders
+        for path in glob.glob(f"{folder}/*")
+        if not path.endswith(".tmp")
+    ]
+    return sorted(paths, key=os.path.getmtime)
+
+
+def continent_openings(folders, expected=None, cache_file=SCAN_CACHE, workers=SCAN_WORKERS):
+    # {continent id: (timestamp, file name)} of the first snapshot with cities
+    # on each continent; stops reading once every expected continent is found
+    openings = {}
+    expected = set(expected) if expected is not None else None
+    with ScanCache("continent_cities", cache_file) as cache, closing(
+        scan(snapshot_files(folders), continent_cities, cache, workers)
+    ) as results:
+        for path, mtime, facts in results:
+            if "invalid" in facts:
+                print(f"Skipping file {path}: {facts['invalid']}")
+                continue
+            for cont_id, cities in facts["continents"].items():
+                if cities and cont_id not in openings:
+                    openings[cont_id] = (mtime, os.path.basename(path))
+            if expected is not None and expected <= openings.keys():
+                break
+    return openings
+
+
+def format_timestamp(timestamp):
+    return datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scan WorldData archives for continent openings")
+    parser.add_argument(
+        "folders",
+        nargs="*",
+        default=[f"{OLD_DATA_DIR}/WorldData", f"{DATA_DIR}/WorldData"],
+    )
+    parser.add_argument("--workers", type=int, default=SCAN_WORKERS)
+    args = parser.parse_args()
+
+    openings = continent_openings(args.folders, workers=args.workers)
+    print("New Continent Openings:")
+    for cont_id, (timestamp, file_name) in sorted(openings.items(), key=lambda x: x[1][0]):
+        print(f"Continent {cont_id}: {file_name} - {format_timestamp(timestamp)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+import argparse
+import asyncio
+import gc
+import math
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+# Continents are 100x100 blocks; the id is "<row><column>", e.g. (358, 463) is on "43"
+CONTINENT_SIZE = 100
+SNAPSHOT_INTERVAL = 6 * 60 * 60
+
+
+def _guid(rng):
+    return str(uuid.UUID(int=rng.getrandbits(128)))
+
+
+def make_players(rng, count, alliances):
+    # Same fields as data_outputs/player_data.txt, minus titles and achievements
+    return [
+        {
+            "playerId": i + 1,
+            "playerGuid": _guid(rng),
+            "allianceId": rng.randrange(alliances) if rng.random() < 0.8 else -1,
+            "username": f"Player{i + 1}",
+            "isAdmin": False,
+            "score": 0,
+            "cityCount": 0,
+            "alternativeTitles": False,
+            "allianceLeavePenalty": "0001-01-01T00:00:00",
+            "playerAchievements": [],
+            "avatarId": rng.randrange(40),
+        }
+        for i in range(count)
+    ]
+
+
+def make_world(rng, players, continents, cities_per_continent):
+    grid = math.ceil(math.sqrt(continents))
+    continent_data = []
+    for i in range(continents):
+        col, row = i % grid, i // grid
+        # Distinct coordinates inside this continent's block
+        cells = rng.sample(range(CONTINENT_SIZE * CONTINENT_SIZE), cities_per_continent)
+        cities = []
+        for cell in cells:
+            owner = rng.choice(players)
+            has_monument = rng.random() < 0.05
+            cities.append(
+                {
+                    "cityGuid": _guid(rng),
+                    "playerGuid": owner["playerGuid"],
+                    "name": f"City {len(cities) + 1}",
+                    "locationX": col * CONTINENT_SIZE + cell % CONTINENT_SIZE,
+                    "locationY": row * CONTINENT_SIZE + cell // CONTINENT_SIZE,
+                    "score": rng.randint(100, 12000),
+                    "isCastle": rng.random() < 0.3,
+                    "isWaterCity": rng.random() < 0.1,
+                    "hasMonument": has_monument,
+                    "monumentType": rng.randrange(6) if has_monument else 0,
+                }
+            )
+        continent_data.append({"continentIdentifier": f"{row}{col}", "cities": cities})
+    return {"continents": continent_data}
+
+
+def advance(rng, world, players, flip_rate):
+    # One interval later: cities grow and a few change owner
+    for cont_data in world["continents"]:
+        for city in cont_data["cities"]:
+            city["score"] += rng.randint(0, 150)
+            if rng.random() < flip_rate:
+                city["playerGuid"] = rng.choice(players)["playerGuid"]
+
+
+def update_player_scores(world, players):
+    totals = {}
+    counts = {}
+    for cont_data in world["continents"]:
+        for city in cont_data["cities"]:
+            guid = city["playerGuid"]
+            totals[guid] = totals.get(guid, 0) + city["score"]
+            counts[guid] = counts.get(guid, 0) + 1
+    for player in players:
+        player["score"] = totals.get(player["playerGuid"], 0)
+        player["cityCount"] = counts.get(player["playerGuid"], 0)
+
+
+def generate(
+    data_dir,
+    continents=8,
+    cities=1500,
+    players=1000,
+    snapshots=12,
+    alliances=7,
+    flip_rate=0.01,
+    seed=0,
+):
+    # Writes snapshots spaced SNAPSHOT_INTERVAL apart ending now, then builds
+    # the ownership log, score history and aggregates the way ingest would
+    from snapshot_archive import ARCHIVE_SUFFIX, write_archive
+
+    import changelog
+    import manifest
+    import score_history
+    import world_stats
+
+    rng = random.Random(seed)
+    player_list = make_players(rng, players, alliances)
+    world = make_world(rng, player_list, continents, cities)
+
+    start = time.time() - (snapshots - 1) * SNAPSHOT_INTERVAL
+    for i in range(snapshots):
+        if i:
+            advance(rng, world, player_list, flip_rate)
+        update_player_scores(world, player_list)
+
+        captured_at = start + i * SNAPSHOT_INTERVAL
+        stamp = time.strftime("%Y%m%dT%H%M%S", time.localtime(captured_at))
+        for dataset, prefix, data in (
+            ("PlayerData", "pdata", player_list),
+            ("WorldData", "wdata", world),
+        ):
+            path = write_archive(
+                f"{data_dir}/{dataset}/{prefix}{stamp}{ARCHIVE_SUFFIX}",
+                dataset,
+                data,
+                captured_at=captured_at,
+            )
+            # Stores order snapshots by mtime
+            os.utime(path, (captured_at, captured_at))
+
+    manifest.rebuild(data_dir)
+    changelog.rebuild(data_dir)
+    score_history.rebuild(data_dir)
+    world_stats.rebuild(data_dir)
+    return world, player_list
+
+
+class FakeAuthor:
+    def __init__(self, name="benchmark#0001"):
+        self.name = name
+
+    def __str__(self):
+        return self.name
+
+
+class FakeContext:
+    # Enough of discord.ext.commands.Context for the command callbacks
+    def __init__(self):
+        self.author = FakeAuthor()
+        self.sent = []
+
+    async def send(self, content=None, *, embed=None, file=None, **kwargs):
+        if file is not None:
+            # Read the attachment so lazily built exports are paid for
+            file.fp.read()
+        self.sent.append((content, embed, file))
+
+
+def pick_cases(world, players):
+    # Arguments for each command, chosen from the generated world
+    cities = [city for cont_data in world["continents"] for city in cont_data["cities"]]
+    alliance_by_guid = {p["playerGuid"]: p["allianceId"] for p in players}
+    target = next(city for city in cities if alliance_by_guid[city["playerGuid"]] != -1)
+    x, y = target["locationX"], target["locationY"]
+    continent = world["continents"][0]["continentIdentifier"]
+    top_players = sorted(players, key=lambda p: p["score"], reverse=True)[:3]
+    names = [p["username"] for p in top_players]
+
+    return [
+        ("citiesflipped", "citiesflipped", (1,)),
+        ("alliancescore", "alliancescore", ()),
+        ("alliancescore continent", "alliancescore", (continent,)),
+        ("attackplanner", "attackplanner", (x, y)),
+        ("altar", "altar", (x, y, 10)),
+        ("monuments", "monuments", ()),
+        ("monuments continent", "monuments", (continent,)),
+        ("playerscore", "playerscore", (*names, "3d")),
+    ]
+
+
+async def _call(bot_module, callback, args):
+    # Repeats would otherwise be answered from the chart cache
+    bot_module.chart_cache.clear()
+    ctx = FakeContext()
+    await callback(ctx, *args)
+    errors = [c for c, _, _ in ctx.sent if c and c.startswith("An error occurred")]
+    if errors:
+        raise RuntimeError(errors[0])
+    return len(ctx.sent)
+
+
+async def measure(bot_module, command, args, repeat):
+    import queries
+
+    # The first run starts with an empty snapshot store (cold), the rest are warm
+    callback = bot_module.bot.get_command(command).callback
+    queries.store.clear()
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        replies = await _call(bot_module, callback, args)
+        timings.append(time.perf_counter() - start)
+
+    # Peak memory of a cold run, traced separately so it doesn't skew timings
+    queries.store.clear()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        await _call(bot_module, callback, args)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return timings, peak, replies
+
+
+async def run(cases, repeat):
+    # Imported late so they pick up ZALENIA_DATA_DIR
+    import bot
+
+    results = []
+    try:
+        for label, command, args in cases:
+            timings, peak, replies = await measure(bot, command, args, repeat)
+            results.append((label, timings, peak, replies))
+    finally:
+        bot.work.shutdown()
+    return results
+
+
+def report(results):
+    print(f"{'command':<26}{'cold ms':>10}{'warm ms':>10}{'min ms':>10}{'peak MiB':>10}{'replies':>9}")
+    for label, timings, peak, replies in results:
+        warm = timings[1:] or timings
+        print(
+            f"{label:<26}"
+            f"{timings[0] * 1000:>10.1f}"
+            f"{statistics.median(warm) * 1000:>10.1f}"
+            f"{min(timings) * 1000:>10.1f}"
+            f"{peak / 2**20:>10.1f}"
+            f"{replies:>9}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time bot commands against synthetic World/Player snapshots"
+    )
+    parser.add_argument("--continents", type=int, default=8)
+    parser.add_argument("--cities", type=int, default=1500, help="cities per continent")
+    parser.add_argument("--players", type=int, default=1000)
+    parser.add_argument("--snapshots", type=int, default=12)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", nargs="*", help="command labels to run")
+    parser.add_argument("--data-dir", help="keep the generated data here")
+    args = parser.parse_args()
+
+    if args.cities > CONTINENT_SIZE * CONTINENT_SIZE:
+        parser.error(f"at most {CONTINENT_SIZE * CONTINENT_SIZE} cities fit on a continent")
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="zbot-bench-")
+    # Must be set before anything imports snapshot_store
+    os.environ["ZALENIA_DATA_DIR"] = data_dir
+    try:
+        start = time.perf_counter()
+        world, players = generate(
+            data_dir,
+            continents=args.continents,
+            cities=args.cities,
+            players=args.players,
+            snapshots=args.snapshots,
+            seed=args.seed,
+        )
+        print(
+            f"Generated {args.snapshots} snapshots of {args.continents * args.cities} cities "
+            f"and {args.players} players in {time.perf_counter() - start:.1f}s"
+        )
+
+        cases = pick_cases(world, players)
+        if args.only:
+            cases = [case for case in cases if case[0] in args.only]
+        report(asyncio.run(run(cases, args.repeat)))
+    finally:
+        if not args.data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,16 +2,16 @@ import discord
 from discord.ext import commands
 import os
 from dotenv import load_dotenv
-import glob
-import pickle
-import json
-import matplotlib.pyplot as plt
 import io
-import csv
+import copy
+import time
 from datetime import datetime
-from matplotlib.ticker import FuncFormatter
-import matplotlib.dates as mdates
-import math
+from workers import WorkPool
+import charts
+import layout_scorer
+import perf
+import queries
+from exports import csv_export
 
 # Load environment variables
 load_dotenv()
@@ -21,17 +21,12 @@ intents = discord.Intents.default()
 intents.message_content = True
 bot = commands.Bot(command_prefix="!", intents=intents)
 
-# Alliance ID to name mapping
-ALLIANCE_NAMES = {
-    "0": "Dragon Fire",
-    "1": "Dragon Claw",
-    "2": "Demons",
-    "3": "Free Time Fun",
-    "4": "44444",
-    "5": "55555",
-    "6": "Zible Believers",
-    # Add more alliances as needed
-}
+# Heavy work runs off the event loop, queued per command; the queries
+# themselves live in queries.py
+work = WorkPool()
+
+# Rendered charts, reused until a newer snapshot lands
+chart_cache = charts.ChartCache()
 
 
 @bot.event
@@ -40,6 +35,104 @@ async def on_ready():
     await bot.change_presence(activity=discord.Game(name="processing Zalenia data!"))
 
 
+@bot.before_invoke
+async def start_timing(ctx):
+    # Spans recorded while this command runs are labelled with its name
+    ctx.perf_token = perf.current_command.set(ctx.command.qualified_name)
+    ctx.perf_start = time.perf_counter()
+    send = ctx.send
+
+    async def timed_send(*args, **kwargs):
+        with perf.span("send"):
+            return await send(*args, **kwargs)
+
+    ctx.send = timed_send
+
+
+@bot.after_invoke
+async def stop_timing(ctx):
+    command = ctx.command.qualified_name
+    perf.metrics.observe("command_seconds", time.perf_counter() - ctx.perf_start, command=command)
+    perf.metrics.incr("commands_total", command=command)
+    if ctx.command_failed:
+        perf.metrics.incr("command_errors_total", command=command)
+    perf.current_command.reset(ctx.perf_token)
+
+
+def format_perf(command=None):
+    lines = [f"{'Command':<16}{'Span':<10}{'Calls':>7}{'Avg ms':>9}{'p95 ms':>9}{'Max ms':>9}{'Total s':>9}"]
+    for name, span, histogram in perf.metrics.spans(command)[:30]:
+        lines.append(
+            f"{name[:15]:<16}{span:<10}{histogram.count:>7}"
+            f"{histogram.sum / histogram.count * 1000:>9.1f}"
+            f"{histogram.quantile(0.95) * 1000:>9.0f}"
+            f"{histogram.max * 1000:>9.1f}"
+            f"{histogram.sum:>9.2f}"
+        )
+
+    counters = {}
+    for (name, labels), value in perf.metrics.counters.items():
+        if command is None or dict(labels).get("command", command) == command:
+            counters[name] = counters.get(name, 0) + value
+    if counters:
+        lines.append("")
+        lines.extend(f"{name}: {value}" for name, value in sorted(counters.items()))
+    return "\n".join(lines)
+
+
+@bot.group(
+    name="perf",
+    description="Show where command time is going",
+    brief="Command timing (admin)",
+    usage="[command] | reset | profile <command line>",
+    help="Shows per-command timing spans (queue, discover, load, compute, render, send) "
+         "and counters collected since the bot started or the last reset.\n\n"
+         "Parameters:\n"
+         "- command: (Optional) Only show this command\n\n"
+         "Example: !perf\n"
+         "Example: !perf alliancescore\n"
+         "Example: !perf reset\n"
+         "Example: !perf profile altar 100 200 8",
+    invoke_without_command=True,
+)
+@commands.guild_only()
+@commands.has_permissions(administrator=True)
+async def perf_command(ctx, command: str = None):
+    uptime = time.time() - perf.metrics.started
+    report = format_perf(command)
+    await ctx.send(f"Timings over the last {uptime / 3600:.1f} hours:\n```\n{report[:1900]}\n```")
+
+
+@perf_command.command(name="reset", brief="Clear collected timings")
+@commands.guild_only()
+@commands.has_permissions(administrator=True)
+async def perf_reset(ctx):
+    perf.metrics.reset()
+    await ctx.send("Timings cleared.")
+
+
+@perf_command.command(name="profile", brief="Profile one command invocation")
+@commands.guild_only()
+@commands.has_permissions(administrator=True)
+async def perf_profile(ctx, *, command_line: str):
+    # Re-dispatch the rest of the message as its own command, under cProfile
+    message = copy.copy(ctx.message)
+    message.content = f"{ctx.prefix}{command_line}"
+    profiled_ctx = await bot.get_context(message)
+    if profiled_ctx.command is None:
+        await ctx.send(f"Unknown command: {command_line}")
+        return
+
+    with perf.capture_profile() as profiles:
+        await bot.invoke(profiled_ctx)
+
+    report = perf.profile_report(profiles)
+    await ctx.send(
+        f"Profile of `{command_line}`:",
+        file=discord.File(io.BytesIO(report.encode("utf-8")), filename="profile.txt"),
+    )
+
+
 @bot.command(
     name="ping",
     description="Check bot's latency",
@@ -57,7 +150,8 @@ async def ping(ctx):
     description="Add intel about a city",
     brief="Add intel for coordinates",
     usage="<x> <y> <message>",
-    help="Adds intel information for a city at the specified coordinates.\n\n"
+    help="Adds intel information for a city at the specified coordinates.\n"
+         "Earlier intel for the same city is kept.\n\n"
          "Parameters:\n"
          "- x: X coordinate of the city\n"
          "- y: Y coordinate of the city\n"
@@ -65,29 +159,7 @@ async def ping(ctx):
          "Example: !inteladd 100 200 Strong castle with T5 troops"
 )
 async def inteladd(ctx, xcoord: int, ycoord: int, *, message: str):
-    intel_file = "D:/ZaleniaData/cityintel.json"
-
-    # Load existing intel
-    try:
-        with open(intel_file, "r") as f:
-            cityintel = json.load(f)
-    except FileNotFoundError:
-        cityintel = {}
-
-    # Create key from coordinates
-    key = f"{xcoord},{ycoord}"
-
-    # Add new intel with timestamp
-    current_datetime = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    cityintel[key] = {
-        "message": message,
-        "added_on": current_datetime,
-        "added_by": str(ctx.author),
-    }
-
-    # Save updated intel
-    with open(intel_file, "w") as f:
-        json.dump(cityintel, f, indent=4)
+    await work.to_thread(queries.add_intel, xcoord, ycoord, message, str(ctx.author))
 
     await ctx.send(f"Intel added for coordinates ({xcoord}, {ycoord}): {message}")
 
@@ -104,31 +176,16 @@ async def inteladd(ctx, xcoord: int, ycoord: int, *, message: str):
          "Example: !intel 100 200"
 )
 async def intel(ctx, xcoord: int, ycoord: int):
-    intel_file = "D:/ZaleniaData/cityintel.json"
-
-    # Load existing intel
-    try:
-        with open(intel_file, "r") as f:
-            cityintel = json.load(f)
-    except FileNotFoundError:
-        await ctx.send("No intel data found.")
-        return
-
-    # Create key from coordinates
-    key = f"{xcoord},{ycoord}"
+    entries = await work.to_thread(queries.intel_at, xcoord, ycoord)
 
-    if key in cityintel:
-        intel_data = cityintel[key]
-        message = intel_data["message"]
-        added_on = intel_data["added_on"]
-        added_by = intel_data["added_by"]
+    if entries:
+        response = f"Intel for coordinates ({xcoord}, {ycoord}):"
+        for entry in entries:
+            response += f"\nMessage: {entry['message']}\n"
+            response += f"Added on: {entry['added_on']}\n"
+            response += f"Added by: {entry['added_by']}"
 
-        response = f"Intel for coordinates ({xcoord}, {ycoord}):\n"
-        response += f"Message: {message}\n"
-        response += f"Added on: {added_on}\n"
-        response += f"Added by: {added_by}"
-
-        await ctx.send(response)
+        await ctx.send(response[:2000])
     else:
         await ctx.send(f"No intel found for coordinates ({xcoord}, {ycoord}).")
 
@@ -138,36 +195,70 @@ async def intel(ctx, xcoord: int, ycoord: int):
     description="Delete intel about a city at specific coordinates",
     brief="Delete intel for a city",
     usage="<x> <y>",
-    help="Deletes stored intel information for a city at the specified coordinates.\n\n"
+    help="Deletes stored intel information for a city at the specified coordinates.\n"
+         "Deleted intel is kept in the history.\n\n"
          "Parameters:\n"
          "- x: X coordinate of the city\n"
          "- y: Y coordinate of the city\n\n"
          "Example: !inteldelete 100 200"
 )
 async def inteldelete(ctx, xcoord: int, ycoord: int):
-    intel_file = "D:/ZaleniaData/cityintel.json"
+    deleted = await work.to_thread(queries.delete_intel, xcoord, ycoord, str(ctx.author))
 
-    # Load existing intel
-    try:
-        with open(intel_file, "r") as f:
-            cityintel = json.load(f)
-    except FileNotFoundError:
-        await ctx.send("No intel data found.")
+    if deleted:
+        await ctx.send(f"Intel for coordinates ({xcoord}, {ycoord}) has been deleted.")
+    else:
+        await ctx.send(f"No intel found for coordinates ({xcoord}, {ycoord}).")
+
+
+@bot.command(
+    name="intelsearch",
+    description="Find intel by continent, city owner or author",
+    brief="Search intel",
+    usage="<continent|owner|author> <value>",
+    help="Lists stored intel matching a continent, city owner or the person who added it.\n\n"
+         "Parameters:\n"
+         "- field: One of continent, owner or author\n"
+         "- value: The continent number or player name to match\n\n"
+         "Example: !intelsearch continent 22\n"
+         "Example: !intelsearch author Officer#1234"
+)
+@work.queued
+async def intelsearch(ctx, field: str, *, value: str):
+    field = field.lower()
+    if field not in ("continent", "owner", "author"):
+        await ctx.send("Search by continent, owner or author.")
+        return
+
+    entries = await work.to_thread(queries.search_intel, field, value)
+    if not entries:
+        await ctx.send(f"No intel found for {field} {value}.")
         return
 
-    # Create key from coordinates
-    key = f"{xcoord},{ycoord}"
+    embed = discord.Embed(
+        title=f"Intel for {field} {value}",
+        description=f"Total: {len(entries)}",
+        color=discord.Color.blue(),
+    )
+    for entry in entries[:25]:
+        embed.add_field(
+            name=f"({entry['x']}:{entry['y']}) {entry['owner'] or 'Unknown'}",
+            value=f"{entry['message'][:200]}\n{entry['added_on']} by {entry['added_by']}",
+            inline=False,
+        )
+    if len(entries) > 25:
+        embed.set_footer(text=f"Showing 25/{len(entries)} entries. Use !intelcsv for all.")
+    await ctx.send(embed=embed)
 
-    if key in cityintel:
-        del cityintel[key]
 
-        # Save updated intel
-        with open(intel_file, "w") as f:
-            json.dump(cityintel, f, indent=4)
+INTEL_CSV_HEADER = ["X", "Y", "Coordinates", "Continent", "City Owner", "Intel", "Timestamp", "Added By"]
 
-        await ctx.send(f"Intel for coordinates ({xcoord}, {ycoord}) has been deleted.")
-    else:
-        await ctx.send(f"No intel found for coordinates ({xcoord}, {ycoord}).")
+
+def export_intel_csv():
+    rows = queries.intel_rows()
+    if rows is None:
+        return None
+    return csv_export("cityintel_export.csv", INTEL_CSV_HEADER, rows)
 
 
 @bot.command(
@@ -178,109 +269,18 @@ async def inteldelete(ctx, xcoord: int, ycoord: int):
     help="Exports all stored intel data to a CSV file, including city coordinates, owners, and intel information.\n\n"
          "Example: !intelcsv"
 )
+@work.queued
 async def intelcsv(ctx):
-    intel_file = "D:/ZaleniaData/cityintel.json"
-    csv_file = "D:/ZaleniaData/cityintel_export.csv"
-
     try:
-        # Load existing intel
-        with open(intel_file, "r") as f:
-            cityintel = json.load(f)
-
-        # Load the latest world data
-        latest_data_file = max(
-            glob.glob("D:/ZaleniaData/WorldData/*"), key=os.path.getctime
-        )
-        with open(latest_data_file, "rb") as fp:
-            latest_world_data = pickle.load(fp)
-
-        # Load the latest player data
-        latest_player_data_file = max(
-            glob.glob("D:/ZaleniaData/PlayerData/*"), key=os.path.getctime
-        )
-        with open(latest_player_data_file, "rb") as fp:
-            player_data = pickle.load(fp)
-
-        # Create a dictionary to map playerGuid to username
-        if isinstance(player_data, list):
-            player_guid_to_name = {
-                player["playerGuid"]: player["username"]
-                for player in player_data
-                if "playerGuid" in player and "username" in player
-            }
-        elif isinstance(player_data, dict) and "players" in player_data:
-            player_guid_to_name = {
-                player["playerGuid"]: player["username"]
-                for player in player_data["players"]
-                if "playerGuid" in player and "username" in player
-            }
-        else:
-            player_guid_to_name = {}
-
-        # Create dictionaries to map coordinates to city owner and continent
-        city_owner_map = {}
-        city_continent_map = {}
-        for continent in latest_world_data["continents"]:
-            cont_id = continent["continentIdentifier"]  # Get the continent ID
-            for city in continent["cities"]:
-                coords = f"{city['locationX']},{city['locationY']}"
-                owner_guid = city["playerGuid"]
-                owner_name = player_guid_to_name.get(owner_guid, owner_guid)
-                city_owner_map[coords] = owner_name
-                city_continent_map[coords] = cont_id  # Store just the continent ID
-
-        # Prepare CSV file
-        with open(csv_file, "w", newline="", encoding="utf-8") as f:
-            writer = csv.writer(f)
-            writer.writerow(
-                ["X", "Y", "Coordinates", "Continent", "City Owner", "Intel", "Timestamp", "Added By"]
-            )
-
-            # Write data
-            for key, value in cityintel.items():
-                x, y = key.split(",")
-                formatted_coords = f"({x}:{y})"
-                continent = city_continent_map.get(key, "Unknown")  # This should now be just the continent number
-                owner = city_owner_map.get(key, "Unknown")
-                
-                if isinstance(value, dict):
-                    writer.writerow(
-                        [
-                            x,
-                            y,
-                            formatted_coords,
-                            continent,  # This should now show correctly
-                            owner,
-                            value.get("message", ""),
-                            value.get("added_on", ""),
-                            value.get("added_by", ""),
-                        ]
-                    )
-                elif isinstance(value, list):
-                    for intel_entry in value:
-                        if isinstance(intel_entry, dict):
-                            writer.writerow(
-                                [
-                                    x,
-                                    y,
-                                    formatted_coords,
-                                    continent,
-                                    owner,
-                                    intel_entry.get("intel", intel_entry.get("message", "")),
-                                    intel_entry.get("timestamp", intel_entry.get("added_on", "")),
-                                    intel_entry.get("added_by", ""),
-                                ]
-                            )
-                        else:
-                            print(f"Skipping invalid intel entry for {key}: {intel_entry}")
-                else:
-                    print(f"Skipping invalid value for {key}: {value}")
+        export = await work.to_thread(export_intel_csv)
+        if export is None:
+            await ctx.send("No intel data found.")
+            return
 
-        # Send the CSV file
-        await ctx.send("Intel data exported to CSV.", file=discord.File(csv_file))
+        # Send the CSV straight from memory
+        buf, filename = export
+        await ctx.send("Intel data exported to CSV.", file=discord.File(buf, filename=filename))
 
-    except FileNotFoundError:
-        await ctx.send("No intel data found.")
     except Exception as e:
         await ctx.send(f"An error occurred: {str(e)}")
         print(f"Error details: {e}")
@@ -298,35 +298,10 @@ async def intelcsv(ctx):
          "Example: !monuments\n"
          "Example: !monuments C1"
 )
+@work.queued
 async def monuments(ctx, contaskedfor="All Conts"):
-    data_file_list = []
-    for name in glob.glob("D:/ZaleniaData/WorldData/*"):
-        data_file_list.append(name)
-    data_file_list.sort(reverse=True)
-
-    with open(data_file_list[0], "rb") as fp:
-        world_data = pickle.load(fp)
-
-    monument_counts = {
-        "Type 0": 0,
-        "Type 1": 0,
-        "Type 2": 0,
-        "Type 3": 0,
-        "Type 4": 0,
-        "Type 5": 0,
-    }
-    for cont_data in world_data["continents"]:
-        if (
-            contaskedfor == "All Conts"
-            or cont_data["continentIdentifier"] == contaskedfor
-        ):
-            for city_data in cont_data["cities"]:
-                if city_data["hasMonument"]:
-                    monument_type = city_data["monumentType"]
-                    if monument_type == 0:
-                        monument_counts["Fire"] += 1
-                    elif 1 <= monument_type <= 5:
-                        monument_counts[f"Type {monument_type}"] += 1
+    cont_id = None if contaskedfor == "All Conts" else contaskedfor
+    monument_counts = await work.to_thread(queries.monument_counts, cont_id)
 
     total_monuments = sum(monument_counts.values())
 
@@ -336,9 +311,9 @@ async def monuments(ctx, contaskedfor="All Conts"):
         color=discord.Color.blue(),
     )
 
-    for monument_name, count in monument_counts.items():
+    for monument_type, count in monument_counts.items():
         embed.add_field(
-            name=f"{monument_name} Monuments", value=str(count), inline=True
+            name=f"Type {monument_type} Monuments", value=str(count), inline=True
         )
 
     file = discord.File("images-files/boticon.png")
@@ -359,92 +334,15 @@ async def monuments(ctx, contaskedfor="All Conts"):
          "Example: !citiesflipped\n"
          "Example: !citiesflipped 3"
 )
+@work.queued
 async def citiesflipped(ctx, days=1):
     try:
-        # Load the latest world data
-        latest_data_file = max(
-            glob.glob("D:/ZaleniaData/WorldData/*"), key=os.path.getctime
-        )
-        with open(latest_data_file, "rb") as fp:
-            latest_world_data = pickle.load(fp)
-
-        # Load the world data from 'days' ago (4 files per day)
-        files_to_go_back = 4 * int(days)
-        all_data_files = sorted(
-            glob.glob("D:/ZaleniaData/WorldData/*"), key=os.path.getctime, reverse=True
-        )
-        if len(all_data_files) <= files_to_go_back:
+        flipped_cities = await work.to_thread(queries.flipped_cities, days)
+        if flipped_cities is None:
             await ctx.send(
                 f"Not enough historical data available for {days} day(s) ago."
             )
             return
-        past_data_file = all_data_files[files_to_go_back]
-        with open(past_data_file, "rb") as fp:
-            past_world_data = pickle.load(fp)
-
-        # Load the latest player data
-        latest_player_data_file = max(
-            glob.glob("D:/ZaleniaData/PlayerData/*"), key=os.path.getctime
-        )
-        with open(latest_player_data_file, "rb") as fp:
-            player_data = pickle.load(fp)
-
-        # Create dictionaries to map playerGuid to username and alliance
-        player_guid_to_name = {}
-        player_guid_to_alliance = {}
-        if isinstance(player_data, list):
-            for player in player_data:
-                if "playerGuid" in player and "username" in player:
-                    player_guid_to_name[player["playerGuid"]] = player["username"]
-                    player_guid_to_alliance[player["playerGuid"]] = player.get(
-                        "allianceId", -1
-                    )
-        elif isinstance(player_data, dict) and "players" in player_data:
-            for player in player_data["players"]:
-                if "playerGuid" in player and "username" in player:
-                    player_guid_to_name[player["playerGuid"]] = player["username"]
-                    player_guid_to_alliance[player["playerGuid"]] = player.get(
-                        "allianceId", -1
-                    )
-
-        flipped_cities = []
-
-        # Compare the two datasets
-        for latest_cont, past_cont in zip(
-            latest_world_data["continents"], past_world_data["continents"]
-        ):
-            for latest_city, past_city in zip(
-                latest_cont["cities"], past_cont["cities"]
-            ):
-                if (
-                    latest_city["cityGuid"] == past_city["cityGuid"]
-                    and latest_city["playerGuid"] != past_city["playerGuid"]
-                ):
-                    old_alliance_id = player_guid_to_alliance.get(
-                        past_city["playerGuid"], -1
-                    )
-                    new_alliance_id = player_guid_to_alliance.get(
-                        latest_city["playerGuid"], -1
-                    )
-                    flipped_cities.append(
-                        {
-                            "name": latest_city["name"],
-                            "continent": latest_cont["continentIdentifier"],
-                            "coords": f"({latest_city['locationX']}, {latest_city['locationY']})",
-                            "old_owner": player_guid_to_name.get(
-                                past_city["playerGuid"], past_city["playerGuid"]
-                            ),
-                            "new_owner": player_guid_to_name.get(
-                                latest_city["playerGuid"], latest_city["playerGuid"]
-                            ),
-                            "old_alliance": ALLIANCE_NAMES.get(
-                                str(old_alliance_id), "Unknown Alliance"
-                            ),
-                            "new_alliance": ALLIANCE_NAMES.get(
-                                str(new_alliance_id), "Unknown Alliance"
-                            ),
-                        }
-                    )
 
         if flipped_cities:
             embed = discord.Embed(
@@ -474,116 +372,222 @@ async def citiesflipped(ctx, days=1):
         await ctx.send(f"An error occurred: {str(e)}")
 
 
+def parse_window(args, default_days):
+    # An optional trailing "14d" sets the window; returns (days, other args)
+    if args and args[-1].lower().endswith("d") and args[-1][:-1].isdigit():
+        return int(args[-1][:-1]), args[:-1]
+    return default_days, args
+
+
 @bot.command(
     name="playerscore",
     description="Chart player scores over time",
     brief="Chart player scores",
-    usage="<player1> [player2] [player3] ...",
-    help="Generates a chart showing score progression for specified players over the last 3 days.\n\n"
+    usage="<player1> [player2] [player3] ... [days]d",
+    help="Generates a chart showing score progression for specified players over the last few days.\n\n"
          "Parameters:\n"
          "- player1: Name of first player to track\n"
-         "- player2, player3, etc: (Optional) Additional players to compare\n\n"
+         "- player2, player3, etc: (Optional) Additional players to compare\n"
+         "- days: (Optional) Number of days to chart, written like 14d. Defaults to 3d\n\n"
          "Example: !playerscore PlayerOne\n"
-         "Example: !playerscore PlayerOne PlayerTwo PlayerThree"
+         "Example: !playerscore PlayerOne PlayerTwo PlayerThree\n"
+         "Example: !playerscore PlayerOne 30d"
 )
+@work.queued
 async def playerscore(ctx, *player_names):
     try:
         if not player_names:
             await ctx.send("Please specify at least one player name.")
             return
 
+        days = 3
+        if len(player_names) > 1:
+            days, player_names = parse_window(player_names, days)
+
         # Convert all input player names to lowercase
         player_names = [name.lower() for name in player_names]
 
-        player_data_files = sorted(
-            glob.glob("D:/ZaleniaData/PlayerData/*"), key=os.path.getmtime, reverse=True
-        )
+        # latest_path can list the data folder, so even a cache hit stays off the loop
+        snapshot = await work.to_thread(queries.snapshot_id, "PlayerData")
+        key = ("playerscore", tuple(player_names), days, snapshot)
+        cached = chart_cache.get(key)
+        if cached is None:
+            player_scores = await work.to_thread(queries.player_scores, player_names, days)
+            missing = [name for name, (dates, scores) in player_scores.items() if not scores]
+
+            # Render the chart in a worker process
+            png = await work.to_process(
+                charts.render_player_scores, player_scores, days, len(player_names)
+            )
+            # The warnings are cached with the chart so repeats still send them
+            chart_cache.put(key, (png, missing), size=len(png))
+        else:
+            png, missing = cached
 
-        days = 3
-        # Calculate the number of files to use (4 times per day)
-        files_to_use = min(days * 4, len(player_data_files))
-        player_data_files = player_data_files[:files_to_use]
-
-        player_scores = {name: [] for name in player_names}
-        dates = []
-
-        for file_path in reversed(player_data_files):
-            with open(file_path, "rb") as fp:
-                player_data = pickle.load(fp)
-
-            file_date = datetime.fromtimestamp(os.path.getmtime(file_path))
-            dates.append(file_date)
-
-            if isinstance(player_data, list):
-                players = player_data
-            elif isinstance(player_data, dict) and "players" in player_data:
-                players = player_data["players"]
-            else:
-                continue
-
-            for player in players:
-                # Convert player username to lowercase for comparison
-                if player["username"].lower() in player_names:
-                    player_scores[player["username"].lower()].append(player["score"])
-
-        plt.figure(figsize=(15, 10))
-        players_with_data = []
-        for name, scores in player_scores.items():
-            if scores:  # Only plot if we have data for this player
-                plt.plot(dates, scores, label=name, marker="o")
-                players_with_data.append(name)
-            else:
-                await ctx.send(f"No data found for player: {name}")
-
-        plt.title(
-            f"Player Scores Over the Last {days} Days ({len(players_with_data)}/{len(player_names)} players)"
-        )
-        plt.xlabel("Date and Time")
-        plt.ylabel("Score")
+        for name in missing:
+            await ctx.send(f"No data found for player: {name}")
+        buf = io.BytesIO(png)
 
-        # Calculate percentage increase and update legend labels
-        legend_labels = []
-        for name, scores in player_scores.items():
-            if scores:
-                first_score = scores[0]
-                last_score = scores[-1]
-                percent_increase = ((last_score - first_score) / first_score) * 100
-                legend_labels.append(f"{name} (+{percent_increase:.2f}%)")
-            else:
-                legend_labels.append(name)
+        # Send the plot as a file
+        await ctx.send(file=discord.File(buf, filename="player_scores.png"))
 
-        plt.legend(
-            legend_labels, loc="upper left"
-        )  # Place legend in the upper left corner
-        plt.grid(True)
+    except Exception as e:
+        import traceback
 
-        # Format y-axis to show full numbers
-        def format_func(value, tick_number):
-            return f"{int(value):,}"
+        traceback.print_exc()
+        await ctx.send(f"An error occurred: {str(e)}")
 
-        plt.gca().yaxis.set_major_formatter(FuncFormatter(format_func))
 
-        # Format x-axis to show full date and time
-        plt.gca().xaxis.set_major_formatter(mdates.DateFormatter("%m-%d %H:%M"))
+@bot.command(
+    name="alliancetrend",
+    description="Chart alliance scores over time",
+    brief="Chart alliance score trend",
+    usage="[continent] [days]d",
+    help="Charts the total score of the top 5 alliances over weeks or months of snapshots.\n\n"
+         "Parameters:\n"
+         "- continent: (Optional) Specific continent to chart\n"
+         "- days: (Optional) Number of days to chart, written like 90d. Defaults to 30d\n\n"
+         "Example: !alliancetrend\n"
+         "Example: !alliancetrend C1 90d"
+)
+@work.queued
+async def alliancetrend(ctx, *args):
+    try:
+        days, args = parse_window(args, 30)
+        continent = args[0] if args else None
+
+        snapshot = await work.to_thread(queries.snapshot_id, "WorldData")
+        key = ("alliancetrend", continent, days, snapshot)
+        png = chart_cache.get(key)
+        if png is None:
+            trend = await work.to_thread(queries.alliance_trend, continent, days)
+            if not trend:
+                await ctx.send(f"No alliance history found for the last {days} day(s).")
+                return
+
+            where = f" on Continent {continent}" if continent else ""
+            png = await work.to_process(
+                charts.render_trend, trend, f"Alliance Scores{where} Over the Last {days} Days", "Score"
+            )
+            chart_cache.put(key, png)
+        await ctx.send(file=discord.File(io.BytesIO(png), filename="alliance_trend.png"))
 
-        # Rotate and align the tick labels so they look better
-        plt.gcf().autofmt_xdate(rotation=45)
+    except Exception as e:
+        await ctx.send(f"An error occurred: {str(e)}")
 
-        # Use a tight layout
-        plt.tight_layout()
 
-        # Save the plot to a bytes buffer
-        buf = io.BytesIO()
-        plt.savefig(buf, format="png")
-        buf.seek(0)
+@bot.command(
+    name="conttrend",
+    description="Chart alliance control of a continent over time",
+    brief="Chart continent control trend",
+    usage="<continent> [days]d",
+    help="Charts each top alliance's share of the alliance-held cities on a continent over time.\n\n"
+         "Parameters:\n"
+         "- continent: Continent to chart\n"
+         "- days: (Optional) Number of days to chart, written like 90d. Defaults to 30d\n\n"
+         "Example: !conttrend C1\n"
+         "Example: !conttrend C1 90d"
+)
+@work.queued
+async def conttrend(ctx, continent: str, window: str = "30d"):
+    try:
+        days, _ = parse_window((window,), 30)
+
+        snapshot = await work.to_thread(queries.snapshot_id, "WorldData")
+        key = ("conttrend", continent, days, snapshot)
+        png = chart_cache.get(key)
+        if png is None:
+            trend = await work.to_thread(queries.alliance_trend, continent, days, True)
+            if not trend:
+                await ctx.send(f"No history found for continent {continent} in the last {days} day(s).")
+                return
+
+            png = await work.to_process(
+                charts.render_trend,
+                trend,
+                f"Control of Continent {continent} Over the Last {days} Days",
+                "Share of alliance-held cities",
+                True,
+            )
+            chart_cache.put(key, png)
+        await ctx.send(file=discord.File(io.BytesIO(png), filename="continent_trend.png"))
 
-        # Send the plot as a file
-        await ctx.send(file=discord.File(buf, filename="player_scores.png"))
+    except Exception as e:
+        await ctx.send(f"An error occurred: {str(e)}")
+
+
+@bot.command(
+    name="contopenings",
+    description="Show when each continent was opened",
+    brief="Continent opening timeline",
+    aliases=["openings"],
+    usage="!contopenings",
+    help="Lists the first snapshot in which each continent had cities, oldest first.\n"
+         "Only snapshots added since the last run are read.\n\n"
+         "Example: !contopenings"
+)
+@work.queued
+async def contopenings(ctx):
+    try:
+        openings = await work.to_thread(queries.continent_openings)
+        if not openings:
+            await ctx.send("No continent openings found.")
+            return
+
+        timeline = sorted(openings.items(), key=lambda item: item[1][0])
+        lines = [
+            f"Continent {cont_id}: {datetime.fromtimestamp(timestamp):%Y-%m-%d %H:%M}"
+            for cont_id, (timestamp, file_name) in timeline
+        ]
+        embed = discord.Embed(
+            title="Continent Openings",
+            description="\n".join(lines)[:4000],
+            color=discord.Color.blue(),
+        )
+        await ctx.send(embed=embed)
 
     except Exception as e:
-        import traceback
+        await ctx.send(f"An error occurred: {str(e)}")
 
-        traceback.print_exc()
+
+@bot.command(
+    name="layoutrank",
+    description="Rank city layouts by resources, adjacency bonuses and free slots",
+    brief="Rank city layouts",
+    aliases=["layouts"],
+    usage="[name] <sharestring> (one per entry, or attach a .txt file)",
+    help="Scores each city sharestring and lists them best first.\n"
+         "Layouts can be given after the command or in an attached text file, "
+         "each optionally preceded by a name. Sharestrings that wrap onto several lines are joined.\n\n"
+         "Example: !layoutrank Alice LL0000...\n"
+         "Bob WW0000..."
+)
+@work.queued
+async def layoutrank(ctx, *, text: str = ""):
+    try:
+        lines = text.splitlines()
+        for attachment in ctx.message.attachments:
+            content = await attachment.read()
+            lines += content.decode("utf-8", errors="replace").splitlines()
+        layouts = layout_scorer.read_layouts(lines)
+        if not layouts:
+            await ctx.send("No sharestrings given.")
+            return
+
+        # Already vectorized; one worker process is plenty for a channel's worth
+        scores, invalid = await work.to_process(layout_scorer.score_layouts, layouts, 1)
+        table = layout_scorer.format_table(scores)
+        note = f"Skipped {len(invalid)} invalid: {', '.join(invalid)}"[:300] if invalid else ""
+
+        if len(table) > 1800:
+            await ctx.send(
+                note or None,
+                file=discord.File(io.BytesIO(table.encode("utf-8")), filename="layouts.txt"),
+            )
+        else:
+            await ctx.send(f"```\n{table}\n```\n{note}")
+
+    except Exception as e:
         await ctx.send(f"An error occurred: {str(e)}")
 
 
@@ -637,64 +641,21 @@ async def logisticcalc(ctx, vehicles: int, hours: int, mins: int):
          "Example: !alliancescore\n"
          "Example: !alliancescore C1"
 )
+@work.queued
 async def alliancescore(ctx, continent: str = None):
     try:
-        # Load the latest player data
-        latest_player_data_file = max(
-            glob.glob("D:/ZaleniaData/PlayerData/*"), key=os.path.getctime
-        )
-        with open(latest_player_data_file, "rb") as fp:
-            player_data = pickle.load(fp)
-
-        # Load the latest world data
-        latest_world_data_file = max(
-            glob.glob("D:/ZaleniaData/WorldData/*"), key=os.path.getctime
-        )
-        with open(latest_world_data_file, "rb") as fp:
-            world_data = pickle.load(fp)
-
-        alliance_score = {}
-        alliance_members = {}
-
-        if isinstance(player_data, list):
-            players = player_data
-        elif isinstance(player_data, dict) and "players" in player_data:
-            players = player_data["players"]
-        else:
+        sorted_alliances = await work.to_thread(queries.alliance_scores, continent)
+        if sorted_alliances is None:
             await ctx.send("Unable to process player data.")
             return
 
-        player_alliance_dict = {
-            player["playerGuid"]: str(player.get("allianceId", -1))
-            for player in players
-        }
-
-        for cont_data in world_data["continents"]:
-            if continent is None or cont_data["continentIdentifier"] == continent:
-                for city_data in cont_data["cities"]:
-                    player_guid = city_data["playerGuid"]
-                    alliance_id = player_alliance_dict.get(player_guid, "-1")
-                    if alliance_id != "-1":
-                        if alliance_id not in alliance_score:
-                            alliance_score[alliance_id] = 0
-                            alliance_members[alliance_id] = set()
-                        alliance_score[alliance_id] += city_data.get("score", 0)
-                        alliance_members[alliance_id].add(player_guid)
-
-        # Sort alliances by total score and get top 5
-        sorted_alliances = sorted(
-            alliance_score.items(), key=lambda x: x[1], reverse=True
-        )[:5]
-
         # Create embed
         embed = discord.Embed(
             title=f"Top 5 Alliance Score Comparison{' on Continent ' + continent if continent else ''}",
             color=discord.Color.blue(),
         )
 
-        for alliance_id, total_score in sorted_alliances:
-            alliance_name = ALLIANCE_NAMES.get(alliance_id, f"Alliance {alliance_id}")
-            member_count = len(alliance_members[alliance_id])
+        for alliance_name, total_score, member_count in sorted_alliances:
             avg_score = total_score / member_count if member_count > 0 else 0
 
             embed.add_field(
@@ -722,136 +683,42 @@ async def alliancescore(ctx, continent: str = None):
          "- y: Y coordinate of the target city\n\n"
          "Example: !attackplanner 100 200"
 )
+@work.queued
 async def attackplanner(ctx, xcoord: int, ycoord: int):
     try:
-        # Load the latest world data
-        latest_world_data_file = max(
-            glob.glob("D:/ZaleniaData/WorldData/*"), key=os.path.getctime
-        )
-        with open(latest_world_data_file, "rb") as fp:
-            world_data = pickle.load(fp)
-
-        # Load the latest player data
-        latest_player_data_file = max(
-            glob.glob("D:/ZaleniaData/PlayerData/*"), key=os.path.getctime
+        continent_id, castles = await work.to_thread(
+            queries.castles_near, xcoord, ycoord
         )
-        with open(latest_player_data_file, "rb") as fp:
-            player_data = pickle.load(fp)
-
-        # Create player_alliance_dict and player_name_dict
-        if isinstance(player_data, list):
-            players = player_data
-        elif isinstance(player_data, dict) and "players" in player_data:
-            players = player_data["players"]
-        else:
+        if continent_id is None and castles is None:
             await ctx.send("Unable to process player data.")
             return
-
-        player_alliance_dict = {
-            player["playerGuid"]: str(player.get("allianceId", -1))
-            for player in players
-        }
-        
-        player_name_dict = {
-            player["playerGuid"]: player["username"]
-            for player in players
-        }
-
-        # Calculate total score for each player
-        player_total_score = {}
-        for cont_data in world_data["continents"]:
-            for city_data in cont_data["cities"]:
-                player_guid = city_data["playerGuid"]
-                if player_guid not in player_total_score:
-                    player_total_score[player_guid] = 0
-                player_total_score[player_guid] += city_data.get("score", 0)
-
-        # Find the continent and alliance of the given coordinates
-        target_continent = None
-        target_alliance = None
-        for cont_data in world_data["continents"]:
-            for city_data in cont_data["cities"]:
-                if (
-                    city_data["locationX"] == xcoord
-                    and city_data["locationY"] == ycoord
-                ):
-                    target_continent = cont_data
-                    player_guid = city_data["playerGuid"]
-                    target_alliance = player_alliance_dict.get(player_guid)
-                    break
-            if target_continent:
-                break
-
-        if not target_continent or not target_alliance:
+        if continent_id is None:
             await ctx.send(f"No city found at coordinates ({xcoord}, {ycoord})")
             return
-
-        castles = []
-        for city_data in cont_data["cities"]:
-            if (
-                city_data["isCastle"]
-                and player_alliance_dict.get(city_data["playerGuid"]) == target_alliance
-            ):
-                player_guid = city_data["playerGuid"]
-                distance = (
-                    (city_data["locationX"] - xcoord) ** 2
-                    + (city_data["locationY"] - ycoord) ** 2
-                ) ** 0.5
-                
-                # Determine special features
-                features = []
-                if city_data.get("hasMonument", False):
-                    monument_type = city_data.get("monumentType", "Unknown")
-                    features.append(f"Monument Type {monument_type}")
-                if city_data.get("isWaterCity", False):
-                    features.append("Water Castle")
-                
-                features_str = ", ".join(features) if features else ""
-                
-                castles.append(
-                    [
-                        city_data["locationX"],
-                        city_data["locationY"],
-                        f"({city_data['locationX']}:{city_data['locationY']})",
-                        cont_data["continentIdentifier"],
-                        city_data["name"],
-                        player_name_dict.get(player_guid, "Unknown"),
-                        city_data["score"],
-                        player_total_score.get(player_guid, 0),
-                        round(distance, 2),
-                        features_str
-                    ]
-                )
-
         if not castles:
             await ctx.send(
                 f"No castles from the same alliance found near ({xcoord}, {ycoord})"
             )
             return
 
-        # Sort castles by distance
-        castles.sort(key=lambda x: x[8])
-
-        # Create and save CSV file
-        filename = f"alliance_castles_{target_continent['continentIdentifier']}.csv"
-        with open(filename, "w", newline="") as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerow([
+        # Build the CSV in memory
+        buf, filename = await work.to_thread(
+            csv_export,
+            f"alliance_castles_{continent_id}.csv",
+            [
                 "X", "Y", "Coordinates", "Continent", "City Name", 
                 "Owner Name", "City Score", "Owner Total Score", "Distance", "Special Features"
-            ])
-            writer.writerows(castles)
+            ],
+            castles,
+        )
 
         # Send the CSV file
-        file = discord.File(filename)
+        file = discord.File(buf, filename=filename)
         await ctx.send(
-            f"Castles of the same alliance on continent {target_continent['continentIdentifier']}, sorted by distance from ({xcoord}, {ycoord}):",
+            f"Castles of the same alliance on continent {continent_id}, sorted by distance from ({xcoord}, {ycoord}):",
             file=file,
         )
 
-        # Clean up the file
-        os.remove(filename)
-
     except Exception as e:
         await ctx.send(f"An error occurred: {str(e)}")
 
@@ -869,94 +736,37 @@ async def attackplanner(ctx, xcoord: int, ycoord: int):
          "Example: !altar 100 200\n"
          "Example: !altar 100 200 10"
 )
+@work.queued
 async def altar(ctx, x: int, y: int, radius: int = 6):
     try:
-        # Load the latest world data
-        latest_world_data_file = max(
-            glob.glob("D:/ZaleniaData/WorldData/*"), key=os.path.getctime
-        )
-        with open(latest_world_data_file, "rb") as fp:
-            world_data = pickle.load(fp)
-
-        # Load the latest player data
-        latest_player_data_file = max(
-            glob.glob("D:/ZaleniaData/PlayerData/*"), key=os.path.getctime
-        )
-        with open(latest_player_data_file, "rb") as fp:
-            player_data = pickle.load(fp)
-
-        # Create dictionaries to map playerGuid to alliance
-        player_guid_to_alliance = {}
-        if isinstance(player_data, list):
-            for player in player_data:
-                if "playerGuid" in player and "allianceId" in player:
-                    player_guid_to_alliance[player["playerGuid"]] = ALLIANCE_NAMES.get(
-                        str(player["allianceId"]), "Unknown"
-                    )
-        elif isinstance(player_data, dict) and "players" in player_data:
-            for player in player_data["players"]:
-                if "playerGuid" in player and "allianceId" in player:
-                    player_guid_to_alliance[player["playerGuid"]] = ALLIANCE_NAMES.get(
-                        str(player["allianceId"]), "Unknown"
-                    )
-
-        # Find the continent of the given coordinates
-        target_continent = None
-        for cont_data in world_data["continents"]:
-            for city in cont_data["cities"]:
-                if city["locationX"] == x and city["locationY"] == y:
-                    target_continent = cont_data
-                    break
-            if target_continent:
-                break
-
-        if not target_continent:
+        surroundings_data = await work.to_thread(queries.altar_surroundings, x, y, radius)
+        if surroundings_data is None:
             await ctx.send(f"No continent found for altar coordinates ({x}, {y})")
             return
 
-        # Generate surroundings data (only cities and castles)
-        surroundings_data = []
-        for city in target_continent["cities"]:
-            dx = city["locationX"] - x
-            dy = city["locationY"] - y
-            distance = math.sqrt(dx**2 + dy**2)
-            if distance <= radius:
-                tile_type = "Castle" if city["isCastle"] else "City"
-                alliance = player_guid_to_alliance.get(city["playerGuid"], "Unknown")
-                surroundings_data.append(
-                    [
-                        city["locationX"],
-                        city["locationY"],
-                        tile_type,
-                        city["name"],
-                        alliance,
-                        round(distance, 2),
-                    ]
-                )
-
-        # Sort by distance
-        surroundings_data.sort(key=lambda x: x[5])
-
-        # Create and save CSV file
-        filename = f"altar_surroundings_{x}_{y}_r{radius}.csv"
-        with open(filename, "w", newline="") as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerow(["X", "Y", "Type", "Name", "Alliance", "Distance"])
-            writer.writerows(surroundings_data)
+        # Build the CSV in memory
+        buf, filename = await work.to_thread(
+            csv_export,
+            f"altar_surroundings_{x}_{y}_r{radius}.csv",
+            ["X", "Y", "Type", "Name", "Alliance", "Distance"],
+            surroundings_data,
+        )
 
         # Send the CSV file
-        file = discord.File(filename)
+        file = discord.File(buf, filename=filename)
         await ctx.send(
             f"Cities and castles within radius {radius} of altar at ({x}, {y}):",
             file=file,
         )
 
-        # Clean up the file
-        os.remove(filename)
-
     except Exception as e:
         await ctx.send(f"An error occurred: {str(e)}")
 
 
 # Run the bot
-bot.run(os.getenv("DISCORD_TOKEN"))
\ No newline at end of file
+if __name__ == "__main__":
+    perf.serve_metrics()
+    try:
+        bot.run(os.getenv("DISCORD_TOKEN"))
+    finally:
+        work.shutdown()
\ No newline at end of file
@@ -0,0 +1,156 @@
+import argparse
+import bisect
+import json
+import os
+import threading
+
+from snapshot_store import DATA_DIR, SnapshotStore
+
+# Append-only log of city ownership changes, one JSON object per line
+CHANGELOG_FILE = f"{DATA_DIR}/ownership_changes.jsonl"
+# Owner of every city as of the last ingested WorldData snapshot
+OWNERS_FILE = f"{DATA_DIR}/city_owners.json"
+
+
+def _city_owners(world_data):
+    owners = {}
+    for cont_data in world_data["continents"]:
+        cont_id = cont_data["continentIdentifier"]
+        for city in cont_data["cities"]:
+            owners[city["cityGuid"]] = (city, cont_id)
+    return owners
+
+
+def diff_ownership(previous_owners, world_data, captured_at):
+    # previous_owners is {cityGuid: playerGuid}; returns (changes, new owners)
+    changes = []
+    owners = {}
+    for city_guid, (city, cont_id) in _city_owners(world_data).items():
+        owner = city["playerGuid"]
+        owners[city_guid] = owner
+        old_owner = previous_owners.get(city_guid)
+        if old_owner is not None and old_owner != owner:
+            changes.append(
+                {
+                    "time": captured_at,
+                    "cityGuid": city_guid,
+                    "name": city.get("name", ""),
+                    "continent": cont_id,
+                    "x": city["locationX"],
+                    "y": city["locationY"],
+                    "oldOwner": old_owner,
+                    "newOwner": owner,
+                }
+            )
+    return changes, owners
+
+
+def record_ownership_changes(
+    world_data, captured_at, log_file=CHANGELOG_FILE, owners_file=OWNERS_FILE
+):
+    # Called by get_data for every WorldData snapshot it saves
+    try:
+        with open(owners_file, "r") as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        state = {"time": None, "owners": {}}
+
+    # Snapshots must be ingested in order for the log to stay sorted
+    if state["time"] is not None and captured_at <= state["time"]:
+        return []
+
+    changes, owners = diff_ownership(state["owners"], world_data, captured_at)
+
+    os.makedirs(os.path.dirname(log_file) or ".", exist_ok=True)
+    if changes:
+        with open(log_file, "a", encoding="utf-8") as f:
+            for change in changes:
+                f.write(json.dumps(change) + "\n")
+
+    tmp_file = f"{owners_file}.tmp"
+    with open(tmp_file, "w") as f:
+        json.dump({"time": captured_at, "owners": owners}, f)
+    os.replace(tmp_file, owners_file)
+    return changes
+
+
+class OwnershipLog:
+    # Reads the log incrementally: only bytes appended since the last call
+    def __init__(self, log_file=CHANGELOG_FILE):
+        self.log_file = log_file
+        self._lock = threading.Lock()
+        self._offset = 0
+        self._times = []
+        self._changes = []
+
+    def _refresh(self):
+        try:
+            size = os.path.getsize(self.log_file)
+        except FileNotFoundError:
+            return
+        if size < self._offset:
+            # Log was rebuilt; start over
+            self._offset = 0
+            self._times = []
+            self._changes = []
+        if size == self._offset:
+            return
+
+        with open(self.log_file, "rb") as f:
+            f.seek(self._offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # Partially written line, pick it up next time
+                self._offset += len(line)
+                change = json.loads(line)
+                self._times.append(change["time"])
+                self._changes.append(change)
+
+    def changes_since(self, since, until=None):
+        with self._lock:
+            self._refresh()
+            start = bisect.bisect_left(self._times, since)
+            end = len(self._times) if until is None else bisect.bisect_right(self._times, until)
+            return self._changes[start:end]
+
+    def net_changes_since(self, since, until=None):
+        # One entry per city: first previous owner -> latest owner, dropping
+        # cities that ended up back with their original owner
+        net = {}
+        for change in self.changes_since(since, until):
+            city_guid = change["cityGuid"]
+            if city_guid in net:
+                net[city_guid] = dict(change, oldOwner=net[city_guid]["oldOwner"])
+            else:
+                net[city_guid] = change
+        return [c for c in net.values() if c["oldOwner"] != c["newOwner"]]
+
+
+def rebuild(data_dir=DATA_DIR):
+    # Replay the whole WorldData archive into a fresh log, oldest first
+    log_file = f"{data_dir}/ownership_changes.jsonl"
+    owners_file = f"{data_dir}/city_owners.json"
+    for path in (log_file, owners_file):
+        if os.path.exists(path):
+            os.remove(path)
+
+    store = SnapshotStore(data_dir, history_size=1)
+    total = 0
+    for path in reversed(store.files("WorldData")):
+        world_data = store.load(path)
+        if not isinstance(world_data, dict) or "continents" not in world_data:
+            print(f"Skipping {path}: Invalid data format")
+            continue
+        changes = record_ownership_changes(
+            world_data, os.path.getmtime(path), log_file, owners_file
+        )
+        total += len(changes)
+    print(f"Recorded {total} ownership changes")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="City ownership change log")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("data_dir", nargs="?", default=DATA_DIR)
+    args = parser.parse_args()
+    rebuild(args.data_dir)
@@ -0,0 +1,142 @@
+import io
+import threading
+from collections import OrderedDict
+
+import matplotlib.dates as mdates
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from matplotlib.ticker import FuncFormatter
+
+import perf
+
+FIGSIZE = (15, 10)
+# Rendered PNGs kept per bot process
+CACHE_BYTES = 32 * 1024 * 1024
+
+
+def _new_figure():
+    # Figures are created directly, not through pyplot, so nothing is kept
+    # in a global registry between renders
+    fig = Figure(figsize=FIGSIZE)
+    FigureCanvasAgg(fig)
+    return fig, fig.add_subplot()
+
+
+def _to_png(fig):
+    try:
+        fig.tight_layout()
+        buf = io.BytesIO()
+        fig.savefig(buf, format="png")
+        return buf.getvalue()
+    finally:
+        fig.clear()
+
+
+def _format_numbers(value, tick_number):
+    return f"{int(value):,}"
+
+
+def _format_percent(value, tick_number):
+    return f"{value:.0f}%"
+
+
+def render_player_scores(series, days, requested_count):
+    # series is {name: (dates, scores)}; runs in a worker process, so
+    # everything in and out must be picklable
+    fig, ax = _new_figure()
+    players_with_data = []
+    for name, (dates, scores) in series.items():
+        if scores:  # Only plot if we have data for this player
+            ax.plot(dates, scores, label=name, marker="o")
+            players_with_data.append(name)
+
+    ax.set_title(
+        f"Player Scores Over the Last {days} Days ({len(players_with_data)}/{requested_count} players)"
+    )
+    ax.set_xlabel("Date and Time")
+    ax.set_ylabel("Score")
+
+    # Calculate percentage increase and update legend labels
+    legend_labels = []
+    for name in players_with_data:
+        scores = series[name][1]
+        first_score = scores[0]
+        last_score = scores[-1]
+        percent_increase = ((last_score - first_score) / first_score) * 100 if first_score else 0
+        legend_labels.append(f"{name} (+{percent_increase:.2f}%)")
+
+    ax.legend(legend_labels, loc="upper left")  # Place legend in the upper left corner
+    ax.grid(True)
+
+    # Format y-axis to show full numbers
+    ax.yaxis.set_major_formatter(FuncFormatter(_format_numbers))
+
+    # Format x-axis to show full date and time
+    ax.xaxis.set_major_formatter(mdates.DateFormatter("%m-%d %H:%M"))
+
+    # Rotate and align the tick labels so they look better
+    fig.autofmt_xdate(rotation=45)
+
+    return _to_png(fig)
+
+
+def render_trend(series, title, ylabel, percent=False):
+    # series is {label: (dates, values)}, already downsampled by the caller
+    fig, ax = _new_figure()
+    for label, (dates, values) in series.items():
+        if len(values):
+            ax.plot(dates, values, label=label)
+
+    ax.set_title(title)
+    ax.set_xlabel("Date")
+    ax.set_ylabel(ylabel)
+    ax.legend(loc="upper left")
+    ax.grid(True)
+    ax.yaxis.set_major_formatter(
+        FuncFormatter(_format_percent if percent else _format_numbers)
+    )
+
+    # Long windows only need the day
+    locator = mdates.AutoDateLocator()
+    ax.xaxis.set_major_locator(locator)
+    ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator))
+    fig.autofmt_xdate(rotation=45)
+
+    return _to_png(fig)
+
+
+class ChartCache:
+    # Rendered PNGs keyed by whatever determines the chart (command,
+    # arguments, latest snapshot), least recently used evicted first. A value
+    # can also carry what else the reply needs, with size set to the PNG's
+    def __init__(self, max_bytes=CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._pngs = OrderedDict()
+        self._size = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._pngs.get(key)
+            png = entry[0] if entry is not None else None
+            if entry is not None:
+                self._pngs.move_to_end(key)
+        perf.metrics.incr("chart_cache_total", result="miss" if png is None else "hit")
+        return png
+
+    def put(self, key, png, size=None):
+        size = len(png) if size is None else size
+        with self._lock:
+            old = self._pngs.pop(key, None)
+            if old is not None:
+                self._size -= old[1]
+            self._pngs[key] = (png, size)
+            self._size += size
+            while self._size > self.max_bytes and len(self._pngs) > 1:
+                _, (_, evicted) = self._pngs.popitem(last=False)
+                self._size -= evicted
+
+    def clear(self):
+        with self._lock:
+            self._pngs.clear()
+            self._size = 0
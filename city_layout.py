@@ -0,0 +1,163 @@
+import numpy as np
+
+# City layouts without pygame: a sharestring is "LL" (land) or "WW" (water)
+# followed by one two-digit code per cell, x-major, GRID_SIZE x GRID_SIZE cells.
+# Layouts with buildings use our own building codes, so they are written as
+# layout strings: LAYOUT_PREFIX plus the same body. Only these tools read
+# them; they can't be pasted into the game.
+GRID_SIZE = 22
+CELLS = GRID_SIZE * GRID_SIZE
+PREFIXES = ("LL", "WW")
+LAYOUT_PREFIX = "zlayout:"
+
+EMPTY = 0
+FOREST = 33
+CLAY = 34
+IRON = 35
+LAKE = 36
+RESOURCE_CODES = (FOREST, CLAY, IRON, LAKE)
+# The codes known to appear in the game's sharestrings
+GAME_CODES = (EMPTY,) + RESOURCE_CODES
+
+# Buildings by image name in opt-buildings. The game's codes for buildings
+# aren't known here, so these are our own and only appear in layout strings
+BUILDING_CODES = {
+    "arcane": 1,
+    "bank": 2,
+    "brickyard": 3,
+    "castle": 4,
+    "cavground": 5,
+    "claypit": 6,
+    "craftmanhut": 7,
+    "farm": 8,
+    "flourmill": 9,
+    "forestcamp": 10,
+    "hallofartisans": 11,
+    "hiddencache": 12,
+    "infantrygrounds": 13,
+    "keep": 14,
+    "lumberyard": 15,
+    "market": 16,
+    "navalyard": 17,
+    "oremine": 18,
+    "oresmelter": 19,
+    "quarters": 20,
+    "seaport": 21,
+    "siegeworkshop": 22,
+    "storagedepot": 23,
+    "warriorstemple": 24,
+}
+# Only allowed in water cities
+WATER_BUILDINGS = ("navalyard", "seaport")
+
+# Mapping of two-digit codes to image filenames in opt-buildings
+CODE_TO_IMAGE = {
+    "33": "forest.jpg",
+    "34": "clay.jpg",
+    "35": "iron.jpg",
+    "36": "lake.jpg",
+    **{f"{code:02d}": f"{name}.jpg" for name, code in BUILDING_CODES.items()},
+}
+
+# Masks indexed [x, y] like the grid
+WALL_MASK = np.zeros((GRID_SIZE, GRID_SIZE), dtype=bool)
+WALL_MASK[[0, -1], :] = True
+WALL_MASK[:, [0, -1]] = True
+CENTER_MASK = np.zeros((GRID_SIZE, GRID_SIZE), dtype=bool)
+CENTER_MASK[10:12, 10:12] = True
+BUILDABLE_MASK = ~(WALL_MASK | CENTER_MASK)
+
+_ZERO = ord("0")
+
+
+def _body(sharestring):
+    sharestring = sharestring.strip()
+    if sharestring.startswith(LAYOUT_PREFIX):
+        sharestring = sharestring[len(LAYOUT_PREFIX) :]
+    prefix = sharestring[:2]
+    if prefix not in PREFIXES:
+        raise ValueError(f"Sharestring must start with {' or '.join(PREFIXES)}")
+    body = "".join(sharestring[2:].split())
+    if len(body) > CELLS * 2:
+        raise ValueError(f"Sharestring has more than {CELLS} cells")
+    if not (body.isascii() and body.isdigit()):
+        raise ValueError("Sharestring cells must be digits")
+    # Shared strings can stop early; the missing cells are empty
+    return prefix, body.ljust(CELLS * 2, "0")
+
+
+def _codes(digits):
+    # (..., CELLS * 2) ASCII digits -> (..., GRID_SIZE, GRID_SIZE) codes
+    digits = digits - _ZERO
+    codes = digits[..., 0::2] * 10 + digits[..., 1::2]
+    return codes.reshape(digits.shape[:-1] + (GRID_SIZE, GRID_SIZE))
+
+
+def decode(sharestring):
+    # (is_water, uint8 grid indexed [x, y]) of a sharestring or layout string
+    prefix, body = _body(sharestring)
+    digits = np.frombuffer(body.encode("ascii"), dtype=np.uint8)
+    return prefix == "WW", _codes(digits)
+
+
+def decode_many(sharestrings):
+    # (is_water, grids, valid) for many layouts in one pass; rows that fail
+    # to parse are empty grids with valid False
+    sharestrings = list(sharestrings)
+    water = np.zeros(len(sharestrings), dtype=bool)
+    valid = np.ones(len(sharestrings), dtype=bool)
+    bodies = []
+    for i, sharestring in enumerate(sharestrings):
+        try:
+            prefix, body = _body(sharestring)
+        except ValueError:
+            valid[i] = False
+            body = "0" * (CELLS * 2)
+        else:
+            water[i] = prefix == "WW"
+        bodies.append(body)
+    digits = np.frombuffer("".join(bodies).encode("ascii"), dtype=np.uint8)
+    return water, _codes(digits.reshape(len(sharestrings), CELLS * 2)), valid
+
+
+def is_game_layout(grid):
+    # True if every cell holds a code the game's sharestrings use
+    return bool(np.isin(grid, GAME_CODES).all())
+
+
+def encode(grid, is_water=False):
+    # A sharestring for the game when the grid only holds game codes,
+    # otherwise a layout string
+    grid = np.asarray(grid, dtype=np.uint8)
+    if grid.shape != (GRID_SIZE, GRID_SIZE) or grid.max(initial=0) > 99:
+        raise ValueError("Not a city grid")
+    digits = np.empty(CELLS * 2, dtype=np.uint8)
+    digits[0::2] = grid.ravel() // 10
+    digits[1::2] = grid.ravel() % 10
+    text = PREFIXES[is_water] + (digits + _ZERO).tobytes().decode("ascii")
+    return text if is_game_layout(grid) else LAYOUT_PREFIX + text
+
+
+def validate(grid):
+    # List of problems, empty for a layout the game or these tools can use.
+    # Resource tiles under the walls are fine; the game's sharestrings have
+    # them (see the example in optimizer.py)
+    grid = np.asarray(grid)
+    if grid.shape != (GRID_SIZE, GRID_SIZE):
+        return [f"Grid is {grid.shape}, expected {(GRID_SIZE, GRID_SIZE)}"]
+    problems = []
+    known = np.isin(grid, GAME_CODES + tuple(BUILDING_CODES.values()))
+    if not known.all():
+        problems.append(f"Unknown codes: {sorted(set(grid[~known].tolist()))}")
+    buildings = np.isin(grid, list(BUILDING_CODES.values()))
+    if buildings[WALL_MASK].any():
+        problems.append(f"{int(buildings[WALL_MASK].sum())} buildings on the walls")
+    if (grid[CENTER_MASK] != EMPTY).any():
+        problems.append("Town center is not empty")
+    return problems
+
+
+def resource_counts(grids):
+    # {code: count} per layout, for one grid or a stack of them
+    grids = np.asarray(grids)
+    return {code: (grids == code).sum(axis=(-2, -1)) for code in RESOURCE_CODES}
@@ -0,0 +1,206 @@
+import numpy as np
+
+MONUMENT_TYPES = 6
+
+
+class WorldTable:
+    # One row per city; strings are stored once as categories and
+    # referenced by integer codes
+    def __init__(
+        self,
+        x,
+        y,
+        score,
+        monument_type,
+        has_monument,
+        is_castle,
+        is_water,
+        continent,
+        player,
+        continents,
+        player_guids,
+        names,
+        city_guids,
+    ):
+        self.x = x
+        self.y = y
+        self.score = score
+        self.monument_type = monument_type
+        self.has_monument = has_monument
+        self.is_castle = is_castle
+        self.is_water = is_water
+        self.continent = continent
+        self.player = player
+        self.continents = continents
+        self.player_guids = player_guids
+        self.names = names
+        self.city_guids = city_guids
+        self._continent_codes = {cont_id: i for i, cont_id in enumerate(continents)}
+
+    def __len__(self):
+        return len(self.x)
+
+    def continent_code(self, cont_id):
+        return self._continent_codes.get(cont_id)
+
+    def continent_mask(self, cont_id=None):
+        # All rows when cont_id is None; no rows for an unknown continent
+        if cont_id is None:
+            return np.ones(len(self), dtype=bool)
+        code = self.continent_code(cont_id)
+        if code is None:
+            return np.zeros(len(self), dtype=bool)
+        return self.continent == code
+
+    def player_alliances(self, players):
+        # allianceId per player code, -1 for unknown players
+        alliance_by_guid = {
+            player["playerGuid"]: player.get("allianceId", -1) for player in players
+        }
+        return np.array(
+            [alliance_by_guid.get(guid, -1) for guid in self.player_guids],
+            dtype=np.int32,
+        )
+
+    def city_alliances(self, players):
+        if not len(self.player_guids):
+            return np.full(len(self), -1, dtype=np.int32)
+        return self.player_alliances(players)[self.player]
+
+    def distances(self, x, y):
+        return np.hypot(self.x - x, self.y - y)
+
+    def row(self, i):
+        return {
+            "locationX": int(self.x[i]),
+            "locationY": int(self.y[i]),
+            "score": int(self.score[i]),
+            "monumentType": int(self.monument_type[i]),
+            "hasMonument": bool(self.has_monument[i]),
+            "isCastle": bool(self.is_castle[i]),
+            "isWaterCity": bool(self.is_water[i]),
+            "continentIdentifier": self.continents[self.continent[i]],
+            "playerGuid": self.player_guids[self.player[i]],
+            "name": self.names[i],
+            "cityGuid": self.city_guids[i],
+        }
+
+
+def build_world_table(world_data):
+    xs, ys, scores, monument_types = [], [], [], []
+    has_monument, is_castle, is_water = [], [], []
+    continent_codes, player_codes = [], []
+    names, city_guids = [], []
+    continents = []
+    player_guids = []
+    player_code_by_guid = {}
+
+    for cont_data in world_data["continents"]:
+        cont_code = len(continents)
+        continents.append(cont_data["continentIdentifier"])
+        for city in cont_data["cities"]:
+            guid = city["playerGuid"]
+            code = player_code_by_guid.get(guid)
+            if code is None:
+                code = player_code_by_guid[guid] = len(player_guids)
+                player_guids.append(guid)
+
+            xs.append(city["locationX"])
+            ys.append(city["locationY"])
+            scores.append(city.get("score") or 0)
+            monument_type = city.get("monumentType")
+            monument_types.append(-1 if monument_type is None else monument_type)
+            has_monument.append(city.get("hasMonument", False))
+            is_castle.append(city.get("isCastle", False))
+            is_water.append(city.get("isWaterCity", False))
+            continent_codes.append(cont_code)
+            player_codes.append(code)
+            names.append(city.get("name", ""))
+            city_guids.append(city.get("cityGuid"))
+
+    return WorldTable(
+        x=np.array(xs, dtype=np.int32),
+        y=np.array(ys, dtype=np.int32),
+        score=np.array(scores, dtype=np.int64),
+        monument_type=np.array(monument_types, dtype=np.int16),
+        has_monument=np.array(has_monument, dtype=bool),
+        is_castle=np.array(is_castle, dtype=bool),
+        is_water=np.array(is_water, dtype=bool),
+        continent=np.array(continent_codes, dtype=np.int16),
+        player=np.array(player_codes, dtype=np.int32),
+        continents=continents,
+        player_guids=player_guids,
+        names=names,
+        city_guids=city_guids,
+    )
+
+
+def monument_counts(table, cont_id=None):
+    # Count of monuments per type 0..5 on one continent or the whole world
+    mask = table.continent_mask(cont_id) & table.has_monument
+    types = table.monument_type[mask]
+    types = types[(types >= 0) & (types < MONUMENT_TYPES)]
+    return np.bincount(types, minlength=MONUMENT_TYPES)
+
+
+def continent_city_counts(table):
+    # Number of cities per continent code
+    return np.bincount(table.continent, minlength=len(table.continents))
+
+
+def player_totals(table):
+    # Total city score per player code
+    return np.bincount(
+        table.player, weights=table.score, minlength=len(table.player_guids)
+    ).astype(np.int64)
+
+
+def alliance_totals(table, players, cont_id=None):
+    # {allianceId: (total score, member count)} for players in an alliance
+    alliances = table.city_alliances(players)
+    mask = table.continent_mask(cont_id) & (alliances != -1)
+    alliances = alliances[mask]
+    if not len(alliances):
+        return {}
+
+    ids, inverse = np.unique(alliances, return_inverse=True)
+    totals = np.bincount(inverse, weights=table.score[mask], minlength=len(ids))
+
+    # Members are distinct players with a city in the selection
+    members = np.unique(np.stack([inverse, table.player[mask]]), axis=1)[0]
+    member_counts = np.bincount(members, minlength=len(ids))
+
+    return {
+        int(alliance_id): (int(total), int(count))
+        for alliance_id, total, count in zip(ids, totals, member_counts)
+    }
+
+
+def alliance_stats(table, players, by_continent=True):
+    # Rows of (continent code or -1, allianceId, total score, members, castles, cities)
+    # for players in an alliance, per continent or for the whole world
+    alliances = table.city_alliances(players)
+    mask = alliances != -1
+    if not mask.any():
+        return []
+
+    continents = table.continent[mask] if by_continent else np.full(mask.sum(), -1)
+    keys, inverse = np.unique(
+        np.stack([continents.astype(np.int64), alliances[mask].astype(np.int64)]),
+        axis=1,
+        return_inverse=True,
+    )
+    inverse = inverse.ravel()
+    groups = keys.shape[1]
+    totals = np.bincount(inverse, weights=table.score[mask], minlength=groups)
+    castles = np.bincount(inverse, weights=table.is_castle[mask], minlength=groups)
+    cities = np.bincount(inverse, minlength=groups)
+    members = np.unique(np.stack([inverse, table.player[mask]]), axis=1)[0]
+    member_counts = np.bincount(members, minlength=groups)
+
+    return [
+        (int(cont), int(alliance), int(total), int(count), int(castle), int(city))
+        for cont, alliance, total, count, castle, city in zip(
+            keys[0], keys[1], totals, member_counts, castles, cities
+        )
+    ]
@@ -0,0 +1,51 @@
+import numpy as np
+
+# Points per line that still read well on a 15 inch wide chart
+MAX_POINTS = 300
+
+
+def lttb(times, values, threshold=MAX_POINTS):
+    # Largest-Triangle-Three-Buckets: keeps the first and last points and,
+    # per bucket, the point that best preserves the shape of the line
+    times = np.asarray(times, dtype=float)
+    values = np.asarray(values, dtype=float)
+    n = len(times)
+    if threshold >= n or threshold < 3:
+        return times, values
+
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    keep = np.empty(threshold, dtype=int)
+    keep[0] = 0
+    keep[-1] = n - 1
+    previous = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        # Average of the next bucket (or the last point) is the third vertex
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        next_t = times[end:next_end].mean()
+        next_v = values[end:next_end].mean()
+
+        t0, v0 = times[previous], values[previous]
+        areas = np.abs(
+            (t0 - next_t) * (values[start:end] - v0)
+            - (t0 - times[start:end]) * (next_v - v0)
+        )
+        previous = start + int(np.argmax(areas))
+        keep[i + 1] = previous
+    return times[keep], values[keep]
+
+
+def bucket_average(times, values, buckets=MAX_POINTS):
+    # Mean time and value per equal-width time bucket; empty buckets are dropped
+    times = np.asarray(times, dtype=float)
+    values = np.asarray(values, dtype=float)
+    if len(times) <= buckets:
+        return times, values
+
+    edges = np.linspace(times[0], times[-1], buckets + 1)
+    index = np.clip(np.searchsorted(edges, times, side="right") - 1, 0, buckets - 1)
+    counts = np.bincount(index, minlength=buckets)
+    filled = counts > 0
+    mean_t = np.bincount(index, weights=times, minlength=buckets)[filled] / counts[filled]
+    mean_v = np.bincount(index, weights=values, minlength=buckets)[filled] / counts[filled]
+    return mean_t, mean_v
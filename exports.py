@@ -0,0 +1,39 @@
+import csv
+import gzip
+import shutil
+import tempfile
+
+# Exports stay in memory up to this size, then spill to an anonymous temp file
+SPOOL_SIZE = 4 * 1024 * 1024
+# Exports larger than this are sent gzipped to stay under Discord's upload limit
+GZIP_OVER = 8 * 1024 * 1024
+
+
+class _Utf8Writer:
+    # csv.writer wants text; the spooled buffer takes bytes
+    def __init__(self, buf):
+        self.buf = buf
+
+    def write(self, text):
+        return self.buf.write(text.encode("utf-8"))
+
+
+def csv_export(filename, header, rows, gzip_over=GZIP_OVER):
+    # Streams rows (any iterable, consumed once) into a private buffer.
+    # Returns (rewound file object, attachment filename); nothing is left on disk.
+    buf = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    writer = csv.writer(_Utf8Writer(buf))
+    writer.writerow(header)
+    for row in rows:
+        writer.writerow(row)
+
+    if gzip_over is not None and buf.tell() > gzip_over:
+        buf.seek(0)
+        compressed = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+        with gzip.GzipFile(filename=filename, mode="wb", fileobj=compressed) as gz:
+            shutil.copyfileobj(buf, gz)
+        buf.close()
+        buf, filename = compressed, f"{filename}.gz"
+
+    buf.seek(0)
+    return buf, filename
@@ -0,0 +1,95 @@
+import asyncio
+import os
+
+import aiohttp
+
+# Overridable so the collector can be pointed at a local stub server
+BASE_URL = os.getenv("ZALENIA_BASE_URL", "https://twilight.zalenia.com")
+
+# (API path, save folder, file prefix)
+ENDPOINTS = [
+    ("/api/world/state", "WorldData", "wdata"),
+    ("/api/player/list", "PlayerData", "pdata"),
+    ("/api/world/dungeons", "DungeonData", "ddata"),
+    ("/api/world/altars", "AltarData", "adata"),
+    ("/api/world/bosses", "BossData", "bdata"),
+]
+
+
+def browser_session(driver):
+    # Cookies and user agent of a logged-in Selenium session
+    cookies = {cookie["name"]: cookie["value"] for cookie in driver.get_cookies()}
+    user_agent = driver.execute_script("return navigator.userAgent")
+    return cookies, user_agent
+
+
+async def _fetch_json(session, url, retries):
+    for attempt in range(retries + 1):
+        try:
+            async with session.get(url) as resp:
+                resp.raise_for_status()
+                # The API doesn't always send a JSON content type
+                return await resp.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            # Retrying won't help once the session has expired
+            if attempt == retries or is_auth_error(e):
+                raise
+            await asyncio.sleep(2**attempt)
+
+
+async def fetch_all(
+    cookies,
+    user_agent=None,
+    endpoints=ENDPOINTS,
+    base_url=BASE_URL,
+    max_connections=5,
+    timeout=60,
+    retries=2,
+):
+    # Returns {folder: data or exception} with every endpoint fetched at once
+    headers = {"Accept": "application/json"}
+    if user_agent:
+        headers["User-Agent"] = user_agent
+
+    connector = aiohttp.TCPConnector(limit=max_connections)
+    async with aiohttp.ClientSession(
+        cookies=cookies,
+        headers=headers,
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(total=timeout),
+    ) as session:
+        results = await asyncio.gather(
+            *(_fetch_json(session, f"{base_url}{path}", retries) for path, _, _ in endpoints),
+            return_exceptions=True,
+        )
+    return {folder: result for (_, folder, _), result in zip(endpoints, results)}
+
+
+def fetch_endpoints(cookies, user_agent=None, **kwargs):
+    return asyncio.run(fetch_all(cookies, user_agent, **kwargs))
+
+
+def is_auth_error(error):
+    return isinstance(error, aiohttp.ClientResponseError) and error.status in (401, 403)
+
+
+async def _check_session(cookies, user_agent, path, base_url, timeout):
+    headers = {"User-Agent": user_agent} if user_agent else {}
+    try:
+        async with aiohttp.ClientSession(
+            cookies=cookies,
+            headers=headers,
+            timeout=aiohttp.ClientTimeout(total=timeout),
+        ) as session:
+            async with session.get(f"{base_url}{path}") as resp:
+                if resp.status != 200:
+                    return False
+                await resp.json(content_type=None)
+                return True
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+        return False
+
+
+def check_session(cookies, user_agent=None, path="/api/world/altars", base_url=BASE_URL, timeout=20):
+    # True when the cookies still get a JSON answer from the API
+    return asyncio.run(_check_session(cookies, user_agent, path, base_url, timeout))
@@ -3,11 +3,42 @@ from selenium_stealth import stealth
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import WebDriverException
 import time
-import pickle
 import json
-from datetime import datetime
+import functools
+import threading
 import os
+import sqlite3
+from snapshot_archive import ARCHIVE_SUFFIX, write_archive
+from changelog import record_ownership_changes
+from score_history import players_from_snapshot, record_player_scores
+from columnar import build_world_table
+from snapshot_store import DATA_DIR, SnapshotStore
+from world_stats import record_world_stats
+from manifest import Manifest
+from scheduler import Job, Scheduler
+from fetcher import (
+    BASE_URL,
+    ENDPOINTS,
+    browser_session,
+    check_session,
+    fetch_endpoints,
+    is_auth_error,
+)
+
+SAVE_FOLDER = DATA_DIR
+
+# Cron schedule per dataset (minute hour day month weekday, local time)
+SCHEDULES = {
+    "WorldData": "0 2,8,14,20 * * *",
+    "PlayerData": "0 * * * *",
+    "DungeonData": "0 2,8,14,20 * * *",
+    "AltarData": "0 2,8,14,20 * * *",
+    "BossData": "*/15 * * * *",
+}
+# Random delay added to each run so we don't hit the API on the exact minute
+JITTER_SECONDS = 30
 
 
 def setup_driver():
@@ -30,7 +61,7 @@ def setup_driver():
 
 
 def login(driver, username, password):
-    driver.get("https://twilight.zalenia.com/")
+    driver.get(f"{BASE_URL}/")
     WebDriverWait(driver, 10).until(
         EC.presence_of_element_located((By.ID, "usernameField"))
     ).send_keys(username)
@@ -53,57 +84,172 @@ def fetch_data(driver, url):
 
 def save_data(data, folder, prefix):
     current_time = time.strftime("%Y%m%dT%H%M%S")
-    filename = f"{folder}/{prefix}{current_time}"
-    os.makedirs(os.path.dirname(filename), exist_ok=True)
-    with open(filename, "wb") as fp:
-        pickle.dump(data, fp)
+    filename = f"{folder}/{prefix}{current_time}{ARCHIVE_SUFFIX}"
+    data_dir, dataset = folder.rsplit("/", 1)
+    path = write_archive(filename, dataset, data)
+    # Recorded for verify; the snapshot itself is already saved, and
+    # "python manifest.py rebuild" picks up anything missed here
+    try:
+        Manifest(data_dir).record(dataset, path)
+    except sqlite3.Error as e:
+        print(f"Could not record {path} in the manifest: {e}")
+    return path
+
+
+def _record_world_stats(data, captured_at):
+    try:
+        players = SnapshotStore(SAVE_FOLDER, history_size=1).players()
+    except FileNotFoundError:
+        players = []
+    record_world_stats(build_world_table(data), players, captured_at)
+
+
+def _record_player_scores(data, captured_at):
+    record_player_scores(players_from_snapshot(data), captured_at)
 
 
-def get_data():
-    driver = setup_driver()
+def _run_hook(name, func, *args):
+    # Everything a hook writes can be rebuilt from the saved snapshots, so a
+    # failure is logged rather than stopping the rest of the collection
     try:
-        login(driver, "1beardedlady", "1beardedlady")
-
-        data_sources = [
-            ("https://twilight.zalenia.com/api/world/state", "WorldData", "wdata"),
-            ("https://twilight.zalenia.com/api/player/list", "PlayerData", "pdata"),
-            ("https://twilight.zalenia.com/api/world/dungeons", "DungeonData", "ddata"),
-            ("https://twilight.zalenia.com/api/world/altars", "AltarData", "adata"),
-            ("https://twilight.zalenia.com/api/world/bosses", "BossData", "bdata"),
-        ]
-
-        save_folder = "D:/ZaleniaData"
-        for url, folder, prefix in data_sources:
-            data = fetch_data(driver, url)
-            save_data(data, f"{save_folder}/{folder}", prefix)
+        func(*args)
+    except Exception as e:
+        print(f"{name} failed, rebuild it from the snapshots later: {e!r}")
+
+
+def store_data(data, folder, prefix):
+    path = save_data(data, f"{SAVE_FOLDER}/{folder}", prefix)
+    if folder == "WorldData":
+        captured_at = os.path.getmtime(path)
+        _run_hook("Ownership log", record_ownership_changes, data, captured_at)
+        _run_hook("World stats", _record_world_stats, data, captured_at)
+    elif folder == "PlayerData":
+        _run_hook("Score history", _record_player_scores, data, os.path.getmtime(path))
+
+
+class CollectorSession:
+    # One browser kept logged in across collection windows; it is only
+    # restarted or logged in again when a health check says so
+    def __init__(self, username, password):
+        self.username = username
+        self.password = password
+        self.driver = None
+        self.cookies = {}
+        self.user_agent = None
+        self.logged_in_at = None
+        self.logins = 0
+
+    def _browser_alive(self):
+        if self.driver is None:
+            return False
+        try:
+            self.driver.current_url
+            return True
+        except WebDriverException:
+            return False
+
+    def relogin(self):
+        if not self._browser_alive():
+            self.close()
+            self.driver = setup_driver()
+        login(self.driver, self.username, self.password)
+        self.cookies, self.user_agent = browser_session(self.driver)
+        self.logged_in_at = time.time()
+        self.logins += 1
+        print(f"Logged in (login #{self.logins})")
+
+    def health_check(self):
+        browser = self._browser_alive()
+        authenticated = browser and bool(self.cookies) and check_session(
+            self.cookies, self.user_agent
+        )
+        return {
+            "browser": browser,
+            "authenticated": authenticated,
+            "session_age": time.time() - self.logged_in_at if self.logged_in_at else None,
+            "logins": self.logins,
+        }
+
+    def ensure(self):
+        if not self.health_check()["authenticated"]:
+            self.relogin()
+        else:
+            # Pick up any cookies the site rotated since the last window
+            self.cookies, self.user_agent = browser_session(self.driver)
+        return self
+
+    def close(self):
+        if self.driver is not None:
+            try:
+                self.driver.quit()
+            except WebDriverException:
+                pass
+            self.driver = None
+            self.cookies = {}
+
+
+def get_data(session, endpoints=ENDPOINTS, concurrent=True):
+    session.ensure()
+
+    results = {}
+    if concurrent:
+        # Reuse the browser login for plain HTTP requests, all at once
+        results = fetch_endpoints(session.cookies, session.user_agent, endpoints=endpoints)
+        if any(is_auth_error(result) for result in results.values()):
+            # Session expired between the health check and the fetch
+            session.relogin()
+            results = fetch_endpoints(
+                session.cookies, session.user_agent, endpoints=endpoints
+            )
+
+    for path, folder, prefix in endpoints:
+        data = results.get(folder)
+        if isinstance(data, Exception):
+            print(f"Fetching {folder} over HTTP failed ({data}), using the browser")
+            data = None
+        if data is None:
+            data = fetch_data(session.driver, f"{BASE_URL}{path}")
             time.sleep(2)
+        store_data(data, folder, prefix)
 
-    finally:
-        driver.quit()
+
+def build_jobs(session):
+    # Endpoints on the same schedule are fetched together in one job
+    by_schedule = {}
+    for endpoint in ENDPOINTS:
+        by_schedule.setdefault(SCHEDULES[endpoint[1]], []).append(endpoint)
+
+    # The browser isn't thread safe, so collections take turns with it
+    session_lock = threading.Lock()
+    jobs = []
+    for expression, endpoints in by_schedule.items():
+        name = "+".join(folder for _, folder, _ in endpoints)
+        jobs.append(
+            Job(
+                name,
+                expression,
+                functools.partial(get_data, session, endpoints),
+                jitter=JITTER_SECONDS,
+                lock=session_lock,
+            )
+        )
+    return jobs
 
 
 def main():
-    time_ranges = [
-        {"start": "01:55:00", "end": "02:05:00"},
-        {"start": "07:55:00", "end": "08:05:00"},
-        {"start": "13:55:00", "end": "14:05:00"},
-        {"start": "19:55:00", "end": "20:05:00"},
-    ]
-
-    while True:
-        now = datetime.now().time()
-        for tr in time_ranges:
-            start = datetime.strptime(tr["start"], "%H:%M:%S").time()
-            end = datetime.strptime(tr["end"], "%H:%M:%S").time()
-            if start <= now <= end or (start > end and (now >= start or now <= end)):
-                print(f"Getting the data at {now}")
-                get_data()
-                print("Sleeping for 5 hours")
-                time.sleep(5 * 60 * 60)
-                break
-        else:
-            print(f"Current time is {now}, waiting 5 minutes.")
-            time.sleep(5 * 60)
+    session = CollectorSession("1beardedlady", "1beardedlady")
+    scheduler = Scheduler(
+        build_jobs(session),
+        max_workers=2,
+        state_file=f"{SAVE_FOLDER}/scheduler_state.json",
+    )
+    try:
+        scheduler.start()
+        for name, run_at in scheduler.upcoming():
+            print(f"Next {name} run at {run_at}")
+        scheduler.run_forever()
+    finally:
+        session.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,122 @@
+import json
+import math
+import os
+
+import pygame
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".bmp")
+# Built atlases, one PNG and manifest per cell size
+ATLAS_DIR = "opt-cache"
+ATLAS_COLUMNS = 8
+
+
+def scale_to_cell(img, cell_size):
+    # Scale the image while maintaining aspect ratio, centered on a
+    # transparent cell
+    img_aspect = img.get_width() / img.get_height()
+    if img_aspect > 1:
+        new_width = cell_size
+        new_height = int(cell_size / img_aspect)
+    else:
+        new_width = int(cell_size * img_aspect)
+        new_height = cell_size
+    img = pygame.transform.scale(img, (new_width, new_height))
+    cell = pygame.Surface((cell_size, cell_size), pygame.SRCALPHA)
+    cell.blit(img, ((cell_size - new_width) // 2, (cell_size - new_height) // 2))
+    return cell
+
+
+class Atlas:
+    # Every image in image_folder pre-scaled to cell_size and packed into one
+    # surface. The cached PNG is rebuilt when a source image is added,
+    # removed or modified; nothing is read until images() is first called
+    def __init__(self, image_folder, cell_size, atlas_dir=ATLAS_DIR):
+        self.image_folder = image_folder
+        self.cell_size = cell_size
+        self.atlas_file = f"{atlas_dir}/atlas-{cell_size}.png"
+        self.manifest_file = f"{atlas_dir}/atlas-{cell_size}.json"
+        self._images = None
+
+    def _sources(self):
+        # {filename: mtime}
+        return {
+            filename: os.path.getmtime(os.path.join(self.image_folder, filename))
+            for filename in sorted(os.listdir(self.image_folder))
+            if filename.endswith(IMAGE_EXTENSIONS)
+        }
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_file, "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _build(self, sources):
+        names = list(sources)
+        columns = min(ATLAS_COLUMNS, len(names)) or 1
+        rows = math.ceil(len(names) / columns) or 1
+        atlas = pygame.Surface(
+            (columns * self.cell_size, rows * self.cell_size), pygame.SRCALPHA
+        )
+        for i, filename in enumerate(names):
+            img = pygame.image.load(os.path.join(self.image_folder, filename))
+            atlas.blit(
+                scale_to_cell(img, self.cell_size),
+                ((i % columns) * self.cell_size, (i // columns) * self.cell_size),
+            )
+
+        os.makedirs(os.path.dirname(self.atlas_file) or ".", exist_ok=True)
+        tmp_file = f"{self.atlas_file}.tmp.png"
+        pygame.image.save(atlas, tmp_file)
+        os.replace(tmp_file, self.atlas_file)
+        # Written last, so a manifest always describes a complete atlas
+        manifest = {"cell_size": self.cell_size, "columns": columns, "sources": sources}
+        tmp_file = f"{self.manifest_file}.tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(manifest, f, indent=4)
+        os.replace(tmp_file, self.manifest_file)
+        return atlas, manifest
+
+    def images(self):
+        # {filename: cell surface}, in file name order; needs a display mode
+        # to be set, since the atlas is converted to the display's format
+        if self._images is not None:
+            return self._images
+
+        sources = self._sources()
+        manifest = self._load_manifest()
+        if (
+            manifest is not None
+            and manifest["sources"] == sources
+            and os.path.exists(self.atlas_file)
+        ):
+            atlas = pygame.image.load(self.atlas_file)
+        else:
+            atlas, manifest = self._build(sources)
+        atlas = atlas.convert_alpha()
+
+        columns = manifest["columns"]
+        self._images = {
+            filename: atlas.subsurface(
+                (
+                    (i % columns) * self.cell_size,
+                    (i // columns) * self.cell_size,
+                    self.cell_size,
+                    self.cell_size,
+                )
+            )
+            for i, filename in enumerate(manifest["sources"])
+        }
+        return self._images
+
+
+_atlases = {}
+
+
+def load_images(image_folder, cell_size):
+    # Atlases stay loaded per cell size, so switching back is free
+    key = (image_folder, cell_size)
+    if key not in _atlases:
+        _atlases[key] = Atlas(image_folder, cell_size)
+    return _atlases[key].images()
@@ -0,0 +1,165 @@
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+from snapshot_store import DATA_DIR
+
+INTEL_DB = f"{DATA_DIR}/cityintel.db"
+# The old single-file store, imported the first time the database is created
+LEGACY_INTEL_FILE = f"{DATA_DIR}/cityintel.json"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS intel (
+    id INTEGER PRIMARY KEY,
+    x INTEGER NOT NULL,
+    y INTEGER NOT NULL,
+    continent TEXT,
+    owner TEXT,
+    message TEXT NOT NULL,
+    added_on TEXT NOT NULL,
+    added_by TEXT NOT NULL,
+    deleted_on TEXT,
+    deleted_by TEXT
+);
+CREATE INDEX IF NOT EXISTS intel_coords ON intel (x, y);
+CREATE INDEX IF NOT EXISTS intel_continent ON intel (continent);
+CREATE INDEX IF NOT EXISTS intel_owner ON intel (owner COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS intel_author ON intel (added_by COLLATE NOCASE);
+"""
+
+
+def _now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _legacy_rows(cityintel):
+    # Old entries were either one dict per key or a list of dicts
+    for key, value in cityintel.items():
+        x, y = (int(v) for v in key.split(","))
+        entries = value if isinstance(value, list) else [value]
+        for entry in entries:
+            if not isinstance(entry, dict):
+                print(f"Skipping invalid intel entry for {key}: {entry}")
+                continue
+            yield (
+                x,
+                y,
+                entry.get("intel", entry.get("message", "")),
+                entry.get("timestamp", entry.get("added_on", "")),
+                entry.get("added_by", ""),
+            )
+
+
+class IntelStore:
+    def __init__(self, db_file=INTEL_DB, legacy_file=LEGACY_INTEL_FILE):
+        self.db_file = db_file
+        self.legacy_file = legacy_file
+        self._initialized = False
+        self._init_lock = threading.Lock()
+        self._local = threading.local()
+
+    def _connect(self):
+        # One connection per worker thread, kept open; the schema and legacy
+        # import only run for the first one in the process
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            return conn
+        os.makedirs(os.path.dirname(self.db_file) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.db_file, timeout=30)
+        conn.row_factory = sqlite3.Row
+        with self._init_lock:
+            if not self._initialized:
+                conn.execute("PRAGMA journal_mode=WAL")
+                with conn:
+                    conn.executescript(SCHEMA)
+                    self._import_legacy(conn)
+                self._initialized = True
+        self._local.conn = conn
+        return conn
+
+    def _import_legacy(self, conn):
+        if conn.execute("SELECT 1 FROM intel LIMIT 1").fetchone():
+            return
+        try:
+            with open(self.legacy_file, "r") as f:
+                cityintel = json.load(f)
+        except FileNotFoundError:
+            return
+        conn.executemany(
+            "INSERT INTO intel (x, y, message, added_on, added_by) VALUES (?, ?, ?, ?, ?)",
+            list(_legacy_rows(cityintel)),
+        )
+
+    def _query(self, sql, params=()):
+        return [dict(row) for row in self._connect().execute(sql, params)]
+
+    def add(self, x, y, message, added_by, continent=None, owner=None):
+        conn = self._connect()
+        with conn:
+            cursor = conn.execute(
+                "INSERT INTO intel (x, y, continent, owner, message, added_on, added_by) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (x, y, continent, owner, message, _now(), added_by),
+            )
+        return cursor.lastrowid
+
+    def delete(self, x, y, deleted_by):
+        # Entries are kept as history; returns how many were active
+        conn = self._connect()
+        with conn:
+            cursor = conn.execute(
+                "UPDATE intel SET deleted_on = ?, deleted_by = ? "
+                "WHERE x = ? AND y = ? AND deleted_on IS NULL",
+                (_now(), deleted_by, x, y),
+            )
+        return cursor.rowcount
+
+    def at(self, x, y, include_deleted=False):
+        sql = "SELECT * FROM intel WHERE x = ? AND y = ?"
+        if not include_deleted:
+            sql += " AND deleted_on IS NULL"
+        return self._query(sql + " ORDER BY id", (x, y))
+
+    def search(self, continent=None, owner=None, author=None, include_deleted=False):
+        clauses = []
+        params = []
+        if continent is not None:
+            clauses.append("continent = ?")
+            params.append(str(continent))
+        if owner is not None:
+            clauses.append("owner = ? COLLATE NOCASE")
+            params.append(owner)
+        if author is not None:
+            clauses.append("added_by = ? COLLATE NOCASE")
+            params.append(author)
+        if not include_deleted:
+            clauses.append("deleted_on IS NULL")
+
+        sql = "SELECT * FROM intel"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        return self._query(sql + " ORDER BY x, y, id", params)
+
+    def fill_missing(self, locate):
+        # Older entries have no continent/owner; locate(x, y) -> (continent, owner)
+        conn = self._connect()
+        rows = conn.execute(
+            "SELECT DISTINCT x, y FROM intel WHERE continent IS NULL"
+        ).fetchall()
+        updates = []
+        for x, y in rows:
+            continent, owner = locate(x, y)
+            if continent is not None:
+                updates.append((str(continent), owner, x, y))
+        with conn:
+            conn.executemany(
+                "UPDATE intel SET continent = ?, owner = ? "
+                "WHERE x = ? AND y = ? AND continent IS NULL",
+                updates,
+            )
+        return len(updates)
+
+    def all(self, include_deleted=False):
+        return self.search(include_deleted=include_deleted)
@@ -0,0 +1,239 @@
+import argparse
+import json
+import math
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import city_layout
+from city_layout import BUILDING_CODES, CELLS, CLAY, EMPTY, FOREST, GRID_SIZE, IRON, LAKE
+
+OPTIMIZE_WORKERS = int(os.getenv("OPTIMIZE_WORKERS", str(os.cpu_count() or 2)))
+# Seconds of wall time per optimize() call, split across rounds of restarts
+TIME_BUDGET = 10.0
+
+# Bonus a building gets for each orthogonally adjacent tile or building.
+# PLACEHOLDERS: these values are guesses, not the game's numbers. Pass the
+# real ones with --bonuses (see load_adjacency) until they are filled in here
+ADJACENCY = {
+    "forestcamp": {FOREST: 3},
+    "lumberyard": {FOREST: 2, "forestcamp": 2},
+    "claypit": {CLAY: 3},
+    "brickyard": {CLAY: 2, "claypit": 2},
+    "oremine": {IRON: 3},
+    "oresmelter": {IRON: 2, "oremine": 2},
+    "farm": {LAKE: 2},
+    "flourmill": {"farm": 2, LAKE: 1},
+    "market": {"bank": 1, "storagedepot": 1},
+    "storagedepot": {"lumberyard": 1, "brickyard": 1, "oresmelter": 1, "flourmill": 1},
+}
+
+# Resource tiles by name, for bonus files
+RESOURCE_NAMES = {"forest": FOREST, "clay": CLAY, "iron": IRON, "lake": LAKE}
+
+# Flat index offsets of the four neighbours; buildable cells never touch the
+# edge of the grid, so they always exist
+NEIGHBOURS = (-GRID_SIZE, -1, 1, GRID_SIZE)
+# Annealing temperature, from start to end of the time budget
+START_TEMPERATURE = 3.0
+END_TEMPERATURE = 0.05
+
+
+def _code(key):
+    if isinstance(key, int):
+        return key
+    return RESOURCE_NAMES[key] if key in RESOURCE_NAMES else BUILDING_CODES[key]
+
+
+def load_adjacency(path):
+    # JSON like ADJACENCY, keyed by building, resource or building names:
+    # {"lumberyard": {"forest": 2, "forestcamp": 2}, ...}
+    with open(path, "r", encoding="utf-8") as f:
+        adjacency = json.load(f)
+    if not isinstance(adjacency, dict) or not all(
+        isinstance(bonuses, dict) for bonuses in adjacency.values()
+    ):
+        raise ValueError(f"{path} must map buildings to {{tile or building: bonus}}")
+    for building, bonuses in adjacency.items():
+        for other, bonus in bonuses.items():
+            if building not in BUILDING_CODES:
+                raise ValueError(f"Unknown building {building} in {path}")
+            if other not in BUILDING_CODES and other not in RESOURCE_NAMES:
+                raise ValueError(f"Unknown tile or building {other} in {path}")
+            if not isinstance(bonus, int):
+                raise ValueError(f"Bonus for {building} next to {other} must be a whole number")
+    return adjacency
+
+
+def bonus_table(adjacency=ADJACENCY):
+    # table[a, b]: what a tile with code a next to one with code b is worth,
+    # counting the bonus each side gets from the other
+    table = np.zeros((100, 100), dtype=np.int64)
+    for building, bonuses in adjacency.items():
+        for other, bonus in bonuses.items():
+            a, b = _code(building), _code(other)
+            table[a, b] += bonus
+            table[b, a] += bonus
+    return table
+
+
+def score(grid, table):
+    grid = np.asarray(grid)
+    return int(
+        table[grid[:-1, :], grid[1:, :]].sum() + table[grid[:, :-1], grid[:, 1:]].sum()
+    )
+
+
+def _pieces(buildings):
+    # {name or code: count} -> [code, ...]
+    return [_code(key) for key, count in buildings.items() for _ in range(count)]
+
+
+def anneal(grid, pieces, table, time_budget, seed):
+    # One simulated annealing run: buildings start on random free cells and
+    # are swapped with other free cells or buildings; returns (score, grid)
+    rng = random.Random(seed)
+    grid = np.asarray(grid, dtype=np.uint8)
+    free = np.flatnonzero(city_layout.BUILDABLE_MASK & (grid == EMPTY)).tolist()
+    if len(pieces) > len(free):
+        raise ValueError(f"{len(pieces)} buildings don't fit in {len(free)} free cells")
+
+    cells = grid.ravel().tolist()
+    rows = table.tolist()
+    rng.shuffle(free)
+    where = free[: len(pieces)]  # cell of each building
+    occupant = [-1] * CELLS  # building on each cell
+    for i, (cell, code) in enumerate(zip(where, pieces)):
+        cells[cell] = code
+        occupant[cell] = i
+
+    def local(cell):
+        row = rows[cells[cell]]
+        return sum(row[cells[cell + offset]] for offset in NEIGHBOURS)
+
+    current = score(np.reshape(cells, grid.shape), table)
+    best, best_cells = current, list(cells)
+    if not pieces:
+        return best, grid
+
+    start = time.perf_counter()
+    ratio = END_TEMPERATURE / START_TEMPERATURE
+    temperature = START_TEMPERATURE
+    iterations = 0
+    while True:
+        iterations += 1
+        if iterations % 256 == 0:
+            elapsed = (time.perf_counter() - start) / time_budget
+            if elapsed >= 1:
+                break
+            temperature = START_TEMPERATURE * ratio**elapsed
+
+        i = rng.randrange(len(pieces))
+        a = where[i]
+        b = rng.choice(free)
+        if cells[a] == cells[b]:
+            continue
+
+        # Only edges around a and b change; an a-b edge is counted twice both
+        # before and after, and is worth the same either way round
+        before = local(a) + local(b)
+        cells[a], cells[b] = cells[b], cells[a]
+        delta = local(a) + local(b) - before
+        if delta >= 0 or rng.random() < math.exp(delta / temperature):
+            j = occupant[b]
+            where[i], occupant[b], occupant[a] = b, i, j
+            if j != -1:
+                where[j] = a
+            current += delta
+            if current > best:
+                best, best_cells = current, list(cells)
+        else:
+            cells[a], cells[b] = cells[b], cells[a]
+
+    return best, np.array(best_cells, dtype=np.uint8).reshape(grid.shape)
+
+
+def optimize(
+    sharestring,
+    buildings,
+    time_budget=TIME_BUDGET,
+    restarts=None,
+    workers=OPTIMIZE_WORKERS,
+    adjacency=ADJACENCY,
+    seed=None,
+):
+    # Places buildings ({name: count}) around the resource tiles of a layout;
+    # returns (score, layout string) of the best of several independent runs
+    is_water, grid = city_layout.decode(sharestring)
+    # Anything already built is cleared, resources stay where they are
+    grid[~np.isin(grid, city_layout.RESOURCE_CODES)] = EMPTY
+    if not is_water:
+        misplaced = [name for name in city_layout.WATER_BUILDINGS if buildings.get(name)]
+        if misplaced:
+            raise ValueError(f"{', '.join(misplaced)} can only be built in water cities")
+
+    pieces = _pieces(buildings)
+    table = bonus_table(adjacency)
+    restarts = restarts or workers
+    rounds = math.ceil(restarts / workers)
+    seeds = random.Random(seed).sample(range(2**31), restarts)
+    args = [(grid, pieces, table, time_budget / rounds, s) for s in seeds]
+
+    if workers == 1:
+        results = [anneal(*arg) for arg in args]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(anneal, *zip(*args)))
+    best, best_grid = max(results, key=lambda result: result[0])
+    return best, city_layout.encode(best_grid, is_water)
+
+
+def parse_buildings(values):
+    # ["forestcamp=4", "lumberyard"] -> {"forestcamp": 4, "lumberyard": 1}
+    buildings = {}
+    for value in values:
+        name, _, count = value.partition("=")
+        if name not in BUILDING_CODES:
+            raise ValueError(f"Unknown building {name}")
+        buildings[name] = buildings.get(name, 0) + int(count or 1)
+    return buildings
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Place buildings around a city's resource tiles for the best adjacency bonuses"
+    )
+    parser.add_argument("sharestring")
+    parser.add_argument("buildings", nargs="+", help="name=count, e.g. forestcamp=4")
+    parser.add_argument("--time", type=float, default=TIME_BUDGET, help="seconds")
+    parser.add_argument("--restarts", type=int)
+    parser.add_argument("--workers", type=int, default=OPTIMIZE_WORKERS)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument(
+        "--bonuses", help="JSON file of adjacency bonuses; the defaults are placeholders"
+    )
+    args = parser.parse_args()
+
+    try:
+        adjacency = load_adjacency(args.bonuses) if args.bonuses else ADJACENCY
+        buildings = parse_buildings(args.buildings)
+        best, layout = optimize(
+            args.sharestring,
+            buildings,
+            time_budget=args.time,
+            restarts=args.restarts,
+            workers=args.workers,
+            adjacency=adjacency,
+            seed=args.seed,
+        )
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    print(f"Score: {best}")
+    print(layout)
+
+
+if __name__ == "__main__":
+    main()
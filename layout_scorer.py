@@ -0,0 +1,150 @@
+import argparse
+import os
+import sys
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import city_layout
+from city_layout import BUILDABLE_MASK, BUILDING_CODES, EMPTY
+from layout_optimizer import ADJACENCY, bonus_table, load_adjacency
+
+SCORE_WORKERS = int(os.getenv("SCORE_WORKERS", str(os.cpu_count() or 2)))
+# Layouts per task; fewer than this are scored without starting processes
+CHUNK_SIZE = 2000
+
+LayoutScore = namedtuple(
+    "LayoutScore", "name water forest clay iron lake buildings free adjacency"
+)
+
+
+def _starts_layout(word):
+    # True for a word a sharestring or layout string can start with
+    if word.startswith(city_layout.LAYOUT_PREFIX):
+        word = word[len(city_layout.LAYOUT_PREFIX) :]
+    rest = word[2:]
+    return word[:2] in city_layout.PREFIXES and (not rest or rest.isdigit())
+
+
+def read_layouts(lines):
+    # [(name, sharestring)] from "[name[:]] SHARESTRING" entries. Sharestrings
+    # copied from the game often wrap, so lines of only digits continue the
+    # previous entry, and a "name:" line names the layout on the next line.
+    # Blank lines and "#" comments are skipped, unnamed layouts are numbered
+    layouts = []
+    name = None
+    for line in lines:
+        words = line.split()
+        if not words or words[0].startswith("#"):
+            continue
+        if layouts and name is None and "".join(words).isdigit():
+            previous, sharestring = layouts[-1]
+            layouts[-1] = (previous, sharestring + "".join(words))
+            continue
+
+        start = next((i for i, word in enumerate(words) if _starts_layout(word)), None)
+        if start is None and line.rstrip().endswith(":"):
+            name = line.strip()[:-1]
+            continue
+        if start is None:
+            # Not a layout; kept so it is reported as invalid
+            start = len(words) - 1
+        if start:
+            name = " ".join(words[:start]).rstrip(":")
+        layouts.append((name or f"#{len(layouts) + 1}", "".join(words[start:])))
+        name = None
+    return layouts
+
+
+def score_chunk(sharestrings, table):
+    # [(valid, water, forest, clay, iron, lake, buildings, free, adjacency)]
+    water, grids, valid = city_layout.decode_many(sharestrings)
+    # Like the editor, anything on the walls or the town center is ignored
+    grids[:, ~BUILDABLE_MASK] = EMPTY
+    adjacency = table[grids[:, :-1, :], grids[:, 1:, :]].sum(axis=(1, 2)) + table[
+        grids[:, :, :-1], grids[:, :, 1:]
+    ].sum(axis=(1, 2))
+    resources = city_layout.resource_counts(grids)
+    buildings = np.isin(grids, list(BUILDING_CODES.values())).sum(axis=(1, 2))
+    free = (grids[:, BUILDABLE_MASK] == EMPTY).sum(axis=1)
+    columns = [valid, water, *resources.values(), buildings, free, adjacency]
+    return list(zip(*(column.tolist() for column in columns)))
+
+
+def score_layouts(layouts, workers=SCORE_WORKERS, adjacency=ADJACENCY):
+    # Returns (scores best first, names of layouts that didn't parse)
+    table = bonus_table(adjacency)
+    sharestrings = [sharestring for _, sharestring in layouts]
+    chunks = [
+        sharestrings[i : i + CHUNK_SIZE] for i in range(0, len(sharestrings), CHUNK_SIZE)
+    ]
+    if workers == 1 or len(chunks) <= 1:
+        results = [score_chunk(chunk, table) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(score_chunk, chunks, [table] * len(chunks)))
+
+    scores = []
+    invalid = []
+    rows = (row for result in results for row in result)
+    for (name, _), (valid, *values) in zip(layouts, rows):
+        if valid:
+            scores.append(LayoutScore(name, *values))
+        else:
+            invalid.append(name)
+
+    # Adjacency bonuses first, then resource tiles, then room left to build
+    scores.sort(
+        key=lambda s: (s.adjacency, s.forest + s.clay + s.iron + s.lake, s.free),
+        reverse=True,
+    )
+    return scores, invalid
+
+
+def format_table(scores):
+    lines = [
+        f"{'#':>3} {'name':<20}{'type':>6}{'forest':>7}{'clay':>6}{'iron':>6}{'lake':>6}"
+        f"{'bldgs':>7}{'free':>6}{'adj':>6}"
+    ]
+    for rank, s in enumerate(scores, 1):
+        lines.append(
+            f"{rank:>3} {s.name[:20]:<20}{'water' if s.water else 'land':>6}"
+            f"{s.forest:>7}{s.clay:>6}{s.iron:>6}{s.lake:>6}"
+            f"{s.buildings:>7}{s.free:>6}{s.adjacency:>6}"
+        )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Rank city layouts from files of \"[name] SHARESTRING\" entries"
+    )
+    parser.add_argument("files", nargs="*", default=["-"], help="- reads stdin")
+    parser.add_argument("--workers", type=int, default=SCORE_WORKERS)
+    parser.add_argument("--top", type=int, help="only print the best N")
+    parser.add_argument(
+        "--bonuses", help="JSON file of adjacency bonuses; the defaults are placeholders"
+    )
+    args = parser.parse_args()
+    try:
+        adjacency = load_adjacency(args.bonuses) if args.bonuses else ADJACENCY
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    layouts = []
+    for path in args.files:
+        if path == "-":
+            layouts += read_layouts(sys.stdin)
+        else:
+            with open(path, "r", encoding="utf-8") as f:
+                layouts += read_layouts(f)
+
+    scores, invalid = score_layouts(layouts, workers=args.workers, adjacency=adjacency)
+    print(format_table(scores[: args.top]))
+    for name in invalid:
+        print(f"Skipping {name}: invalid sharestring", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
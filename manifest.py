@@ -0,0 +1,189 @@
+import argparse
+import glob
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import namedtuple
+
+# One row per saved snapshot, so "latest" and time-range lookups are index
+# queries instead of a glob plus a stat per file, and archives can be
+# checked for corruption or loss
+MANIFEST_FILE = "manifest.db"
+DATASETS = ["WorldData", "PlayerData", "DungeonData", "AltarData", "BossData"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    path TEXT PRIMARY KEY,
+    dataset TEXT NOT NULL,
+    captured_at REAL NOT NULL,
+    size INTEGER NOT NULL,
+    checksum TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS snapshots_time ON snapshots (dataset, captured_at);
+-- Folder mtime as of the last record; if the folder has changed since,
+-- something was saved or removed without going through the manifest
+CREATE TABLE IF NOT EXISTS folders (
+    dataset TEXT PRIMARY KEY,
+    mtime REAL NOT NULL
+);
+"""
+
+SnapshotEntry = namedtuple("SnapshotEntry", "dataset path captured_at size checksum")
+
+
+def checksum(path):
+    with open(path, "rb") as fp:
+        return hashlib.file_digest(fp, "sha256").hexdigest()
+
+
+class Manifest:
+    # Paths are stored relative to data_dir and returned absolute
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        self.db_file = f"{data_dir}/{MANIFEST_FILE}"
+        # One read connection for the life of the process, shared by worker
+        # threads under the lock
+        self._lock = threading.Lock()
+        self._reader = None
+
+    def exists(self):
+        return os.path.exists(self.db_file)
+
+    def _connect(self):
+        # Writers create the schema; the reader only opens an existing file
+        os.makedirs(self.data_dir, exist_ok=True)
+        conn = sqlite3.connect(self.db_file, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        return conn
+
+    def _entry(self, row):
+        dataset, path, captured_at, size, digest = row
+        return SnapshotEntry(dataset, f"{self.data_dir}/{path}", captured_at, size, digest)
+
+    def _execute(self, sql, params):
+        with self._lock:
+            if self._reader is None:
+                if not self.exists():
+                    return []
+                self._reader = sqlite3.connect(
+                    self.db_file, timeout=30, check_same_thread=False
+                )
+            return self._reader.execute(sql, params).fetchall()
+
+    def _query(self, sql, params):
+        return [
+            self._entry(row)
+            for row in self._execute(
+                "SELECT dataset, path, captured_at, size, checksum FROM snapshots " + sql,
+                params,
+            )
+        ]
+
+    def close(self):
+        with self._lock:
+            if self._reader is not None:
+                self._reader.close()
+                self._reader = None
+
+    def record(self, dataset, path, captured_at=None):
+        # Called by get_data right after a snapshot is written
+        if captured_at is None:
+            captured_at = os.path.getmtime(path)
+        relative = os.path.relpath(path, self.data_dir).replace(os.sep, "/")
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?, ?)",
+                    (relative, dataset, captured_at, os.path.getsize(path), checksum(path)),
+                )
+                conn.execute(
+                    "INSERT OR REPLACE INTO folders VALUES (?, ?)",
+                    (dataset, os.path.getmtime(os.path.dirname(path))),
+                )
+        finally:
+            conn.close()
+
+    def folder_mtime(self, dataset):
+        # Folder mtime when the dataset was last recorded, or None
+        rows = self._execute("SELECT mtime FROM folders WHERE dataset = ?", (dataset,))
+        return rows[0][0] if rows else None
+
+    def latest(self, dataset):
+        rows = self._query(
+            "WHERE dataset = ? ORDER BY captured_at DESC LIMIT 1", (dataset,)
+        )
+        return rows[0] if rows else None
+
+    def oldest(self, dataset):
+        rows = self._query("WHERE dataset = ? ORDER BY captured_at LIMIT 1", (dataset,))
+        return rows[0] if rows else None
+
+    def at_or_before(self, dataset, time):
+        # Newest snapshot captured at or before time, e.g. "3 days ago"
+        rows = self._query(
+            "WHERE dataset = ? AND captured_at <= ? ORDER BY captured_at DESC LIMIT 1",
+            (dataset, time),
+        )
+        return rows[0] if rows else None
+
+    def between(self, dataset, since=None, until=None):
+        # Oldest first
+        return self._query(
+            "WHERE dataset = ? AND captured_at >= ? AND captured_at <= ? ORDER BY captured_at",
+            (
+                dataset,
+                since if since is not None else float("-inf"),
+                until if until is not None else float("inf"),
+            ),
+        )
+
+    def verify(self, entry):
+        return (
+            os.path.exists(entry.path)
+            and os.path.getsize(entry.path) == entry.size
+            and checksum(entry.path) == entry.checksum
+        )
+
+
+def rebuild(data_dir):
+    # Index every snapshot already on disk, e.g. after converting archives
+    manifest = Manifest(data_dir)
+    if manifest.exists():
+        os.remove(manifest.db_file)
+
+    total = 0
+    for dataset in DATASETS:
+        for path in glob.glob(f"{data_dir}/{dataset}/*"):
+            if path.endswith(".tmp"):
+                continue
+            manifest.record(dataset, path)
+            total += 1
+    print(f"Indexed {total} snapshots")
+
+
+def verify(data_dir):
+    manifest = Manifest(data_dir)
+    bad = 0
+    for dataset in DATASETS:
+        for entry in manifest.between(dataset):
+            if not manifest.verify(entry):
+                print(f"Missing or changed: {entry.path}")
+                bad += 1
+    print(f"{bad} bad snapshots")
+    manifest.close()
+
+
+if __name__ == "__main__":
+    from snapshot_store import DATA_DIR
+
+    parser = argparse.ArgumentParser(description="Snapshot manifest")
+    parser.add_argument("command", choices=["rebuild", "verify"])
+    parser.add_argument("data_dir", nargs="?", default=DATA_DIR)
+    args = parser.parse_args()
+    if args.command == "rebuild":
+        rebuild(args.data_dir)
+    else:
+        verify(args.data_dir)
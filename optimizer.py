@@ -1,13 +1,15 @@
 import pygame
 import sys
-import os
 import pygame_gui
 
+import city_layout
+import image_atlas
+from city_layout import CODE_TO_IMAGE, GRID_SIZE
+
 # Initialize Pygame
 pygame.init()
 
 # Constants
-GRID_SIZE = 22
 CELL_SIZE = 30
 SCREEN_SIZE = GRID_SIZE * CELL_SIZE
 SIDEBAR_WIDTH = 200
@@ -25,37 +27,12 @@ RED = (255, 0, 0)
 screen = pygame.display.set_mode((SCREEN_SIZE + SIDEBAR_WIDTH, SCREEN_SIZE))
 pygame.display.set_caption("City Grid")
 
-# Load images
+# Load images, pre-scaled to CELL_SIZE and cached in opt-cache
 image_folder = "opt-buildings"  # Change this to your opt-buildings folder path
-images = {}
-for filename in os.listdir(image_folder):
-    if filename.endswith((".png", ".jpg", ".bmp")):
-        img = pygame.image.load(os.path.join(image_folder, filename))
-        # Scale the image while maintaining aspect ratio
-        img_aspect = img.get_width() / img.get_height()
-        if img_aspect > 1:
-            new_width = CELL_SIZE
-            new_height = int(CELL_SIZE / img_aspect)
-        else:
-            new_width = int(CELL_SIZE * img_aspect)
-            new_height = CELL_SIZE
-        img = pygame.transform.scale(img, (new_width, new_height))
-        # Create a new surface with alpha channel
-        scaled_img = pygame.Surface((CELL_SIZE, CELL_SIZE), pygame.SRCALPHA)
-        # Center the scaled image on the new surface
-        x_offset = (CELL_SIZE - new_width) // 2
-        y_offset = (CELL_SIZE - new_height) // 2
-        scaled_img.blit(img, (x_offset, y_offset))
-        images[filename] = scaled_img
+images = image_atlas.load_images(image_folder, CELL_SIZE)
 
 # Mapping of two-digit codes to image filenames
-code_to_image = {
-    "33": "forest.jpg",
-    "34": "clay.jpg",
-    "35": "iron.jpg",
-    "36": "lake.jpg",
-    # Add more mappings as needed
-}
+code_to_image = CODE_TO_IMAGE
 
 # City grid
 city_grid = [[None for _ in range(GRID_SIZE)] for _ in range(GRID_SIZE)]
@@ -65,56 +42,95 @@ selected_image = None
 
 
 def parse_sharestring(sharestring):
-    # Remove the first two characters (LL or WW) and any newlines
-    sharestring = sharestring[2:].replace("\n", "")
+    _, layout = city_layout.decode(sharestring)
+    # Codes on the walls and the center 4 squares are never drawn
+    layout[~city_layout.BUILDABLE_MASK] = city_layout.EMPTY
 
-    for x in range(GRID_SIZE):
-        for y in range(GRID_SIZE):
-            # Skip the center 4 squares
-            if (x in [10, 11]) and (y in [10, 11]):
-                continue
-            index = x * GRID_SIZE * 2 + y * 2
-            code = sharestring[index : index + 2]
-            if code in code_to_image and code_to_image[code] in images:
-                city_grid[x][y] = images[code_to_image[code]]
+    for x, y in zip(*layout.nonzero()):
+        code = f"{layout[x, y]:02d}"
+        if code in code_to_image and code_to_image[code] in images:
+            city_grid[x][y] = images[code_to_image[code]]
 
 
-def draw_grid():
+# Static layers, drawn once: the empty city and the sidebar palette
+def render_city_background():
+    background = pygame.Surface((SCREEN_SIZE, SCREEN_SIZE))
+    background.fill(WHITE)
     for x in range(0, SCREEN_SIZE, CELL_SIZE):
-        pygame.draw.line(screen, GRAY, (x, 0), (x, SCREEN_SIZE))
+        pygame.draw.line(background, GRAY, (x, 0), (x, SCREEN_SIZE))
     for y in range(0, SCREEN_SIZE, CELL_SIZE):
-        pygame.draw.line(screen, GRAY, (0, y), (SCREEN_SIZE, y))
-
-
-def draw_city():
+        pygame.draw.line(background, GRAY, (0, y), (SCREEN_SIZE, y))
     for x in range(GRID_SIZE):
         for y in range(GRID_SIZE):
             # Draw the outer walls
-            if x == 0 or x == GRID_SIZE - 1 or y == 0 or y == GRID_SIZE - 1:
-                pygame.draw.rect(
-                    screen, BLACK, (x * CELL_SIZE, y * CELL_SIZE, CELL_SIZE, CELL_SIZE)
-                )
+            if city_layout.WALL_MASK[x, y]:
+                pygame.draw.rect(background, BLACK, cell_rect(x, y))
             # Draw the center 4 squares as red
-            elif (x in [10, 11]) and (y in [10, 11]):
-                pygame.draw.rect(
-                    screen, RED, (x * CELL_SIZE, y * CELL_SIZE, CELL_SIZE, CELL_SIZE)
-                )
-            elif city_grid[x][y]:
-                screen.blit(city_grid[x][y], (x * CELL_SIZE, y * CELL_SIZE))
+            elif city_layout.CENTER_MASK[x, y]:
+                pygame.draw.rect(background, RED, cell_rect(x, y))
+    return background
 
 
-def draw_sidebar():
-    pygame.draw.rect(screen, WHITE, (SCREEN_SIZE, 0, SIDEBAR_WIDTH, SCREEN_SIZE))
+def render_sidebar():
+    sidebar = pygame.Surface((SIDEBAR_WIDTH, SCREEN_SIZE))
+    sidebar.fill(WHITE)
     y = 10
-    x = SCREEN_SIZE + 10
-    for filename, img in images.items():
-        screen.blit(img, (x, y))
+    x = 10
+    for img in palette:
+        sidebar.blit(img, (x, y))
         y += CELL_SIZE + 5
         if y > SCREEN_SIZE - 100:  # Leave space for the input and button
             y = 10
             x += CELL_SIZE + 5
+    return sidebar
 
 
+def cell_rect(x, y):
+    return pygame.Rect(x * CELL_SIZE, y * CELL_SIZE, CELL_SIZE, CELL_SIZE)
+
+
+# The draw functions return the area they changed, for display.update()
+def draw_cell(x, y):
+    rect = cell_rect(x, y)
+    screen.blit(city_background, rect, rect)
+    if city_grid[x][y]:
+        screen.blit(city_grid[x][y], rect)
+    return rect
+
+
+def draw_city():
+    screen.blit(city_background, (0, 0))
+    for x in range(GRID_SIZE):
+        for y in range(GRID_SIZE):
+            if city_grid[x][y]:
+                screen.blit(city_grid[x][y], (x * CELL_SIZE, y * CELL_SIZE))
+    return CITY_RECT
+
+
+def draw_sidebar():
+    screen.blit(sidebar_background, (SCREEN_SIZE, 0))
+    return SIDEBAR_RECT
+
+
+def draw_ui():
+    # pygame_gui redraws its elements every frame, so their corner of the
+    # sidebar is cleared first
+    screen.blit(sidebar_background, UI_RECT, UI_RECT.move(-SCREEN_SIZE, 0))
+    manager.draw_ui(screen)
+    return UI_RECT
+
+
+CITY_RECT = pygame.Rect(0, 0, SCREEN_SIZE, SCREEN_SIZE)
+SIDEBAR_RECT = pygame.Rect(SCREEN_SIZE, 0, SIDEBAR_WIDTH, SCREEN_SIZE)
+UI_RECT = pygame.Rect(SCREEN_SIZE, SCREEN_SIZE - 60, SIDEBAR_WIDTH, 60)
+# How often to wake up while idle, so the text cursor keeps blinking
+BLINK_MS = 250
+
+# Sidebar images in the order they are drawn
+palette = list(images.values())
+city_background = render_city_background()
+sidebar_background = render_sidebar()
+
 # Create text input for sharestring
 sharestring_input = pygame_gui.elements.UITextEntryLine(
     relative_rect=pygame.Rect(
@@ -137,16 +153,29 @@ sharestring = "LL000000000000000000000000000000000000000000000033333300000000000
 # Parse the sharestring and populate the city grid
 parse_sharestring(sharestring)
 
-# Main game loop
+# Main game loop; only what changed is redrawn, and it sleeps while nothing happens
 running = True
 clock = pygame.time.Clock()
+draw_city()
+draw_sidebar()
+draw_ui()
+pygame.display.flip()
 while running:
+    events = pygame.event.get()
+    if not events:
+        event = pygame.event.wait(BLINK_MS if sharestring_input.is_focused else 0)
+        events = [event] if event.type != pygame.NOEVENT else []
     time_delta = clock.tick(60) / 1000.0
+    dirty = []
 
-    for event in pygame.event.get():
+    for event in events:
         if event.type == pygame.QUIT:
             running = False
 
+        # The window was uncovered; the screen surface still holds everything
+        if event.type == pygame.WINDOWEXPOSED:
+            dirty.append(screen.get_rect())
+
         if event.type == pygame.MOUSEBUTTONDOWN:
             x, y = event.pos
             if x < SCREEN_SIZE:
@@ -161,37 +190,36 @@ while running:
                         11,
                     ]:  # Avoid center 4 squares
                         city_grid[grid_x][grid_y] = selected_image
+                        dirty.append(draw_cell(grid_x, grid_y))
             else:
                 # Check if clicked on an image in the sidebar
                 sidebar_x = (x - SCREEN_SIZE) // (CELL_SIZE + 5)
                 sidebar_y = y // (CELL_SIZE + 5)
                 index = sidebar_y + sidebar_x * ((SCREEN_SIZE - 100) // (CELL_SIZE + 5))
-                if index < len(images):
-                    selected_image = list(images.values())[index]
+                if index < len(palette):
+                    selected_image = palette[index]
 
         if event.type == pygame.USEREVENT:
             if event.user_type == pygame_gui.UI_BUTTON_PRESSED:
                 if event.ui_element == update_button:
                     new_sharestring = sharestring_input.get_text()
-                    if new_sharestring.startswith("LL") or new_sharestring.startswith(
-                        "WW"
-                    ):
+                    try:
+                        city_layout.decode(new_sharestring)
+                    except ValueError as e:
+                        print(f"Invalid sharestring: {e}")
+                    else:
                         # Clear the current city grid
                         city_grid = [
                             [None for _ in range(GRID_SIZE)] for _ in range(GRID_SIZE)
                         ]
                         # Parse the new sharestring and update the city layout
                         parse_sharestring(new_sharestring)
+                        dirty.append(draw_city())
 
         manager.process_events(event)
 
     manager.update(time_delta)
-
-    screen.fill(WHITE)
-    draw_grid()
-    draw_city()
-    draw_sidebar()
-    manager.draw_ui(screen)
-    pygame.display.flip()
+    dirty.append(draw_ui())
+    pygame.display.update(dirty)
 
 pygame.quit()
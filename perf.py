@@ -0,0 +1,220 @@
+import contextlib
+import contextvars
+import cProfile
+import functools
+import io
+import os
+import pstats
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds in seconds, as in a Prometheus histogram
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# Set to expose /metrics in Prometheus text format
+METRICS_PORT = os.getenv("BOT_METRICS_PORT")
+
+# Command whose work is being timed; copied into worker threads with the context
+current_command = contextvars.ContextVar("current_command", default="-")
+# Profilers of the invocation being profiled, if any
+_profiles = contextvars.ContextVar("profiles", default=None)
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th observation
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.max
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (name, (label pairs)) -> value / Histogram
+        self.counters = {}
+        self.histograms = {}
+        self.started = time.time()
+
+    def incr(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextlib.contextmanager
+    def span(self, name):
+        # Time one stage (discover, load, compute, render, send) of the current command
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(
+                "span_seconds",
+                time.perf_counter() - start,
+                span=name,
+                command=current_command.get(),
+            )
+
+    def spans(self, command=None):
+        # [(command, span, histogram)] sorted by total time spent
+        with self._lock:
+            rows = [
+                (labels["command"], labels["span"], histogram)
+                for (name, label_pairs), histogram in self.histograms.items()
+                if name == "span_seconds"
+                for labels in [dict(label_pairs)]
+                if command is None or labels["command"] == command
+            ]
+        return sorted(rows, key=lambda row: row[2].sum, reverse=True)
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+            self.started = time.time()
+
+    def prometheus(self):
+        def fmt_labels(label_pairs, extra=()):
+            pairs = list(label_pairs) + list(extra)
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+        lines = []
+        with self._lock:
+            for (name, label_pairs), value in sorted(self.counters.items()):
+                lines.append(f"zbot_{name}{fmt_labels(label_pairs)} {value}")
+            for (name, label_pairs), histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip(BUCKETS, histogram.counts):
+                    cumulative += count
+                    lines.append(
+                        f"zbot_{name}_bucket{fmt_labels(label_pairs, [('le', bound)])} {cumulative}"
+                    )
+                lines.append(
+                    f"zbot_{name}_bucket{fmt_labels(label_pairs, [('le', '+Inf')])} {histogram.count}"
+                )
+                lines.append(f"zbot_{name}_sum{fmt_labels(label_pairs)} {histogram.sum:.6f}")
+                lines.append(f"zbot_{name}_count{fmt_labels(label_pairs)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+def span(name):
+    return metrics.span(name)
+
+
+def timed(name):
+    # Decorator form of span()
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with metrics.span(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def profiled(func):
+    # Runs func under its own profiler when the calling command is being profiled
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        profiles = _profiles.get()
+        if profiles is None:
+            return func(*args, **kwargs)
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # From Python 3.12 only one profiler can run per process; the one
+            # capture_profile() started already sees this thread
+            return func(*args, **kwargs)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile.disable()
+            profiles.append(profile)
+
+    return wrapper
+
+
+@contextlib.contextmanager
+def capture_profile():
+    # Profiles the event loop thread and any worker-thread work started
+    # inside the block; yields a list that ends up holding the profilers
+    profiles = []
+    token = _profiles.set(profiles)
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield profiles
+    finally:
+        profile.disable()
+        profiles.append(profile)
+        _profiles.reset(token)
+
+
+def profile_report(profiles, sort="cumulative", limit=40):
+    out = io.StringIO()
+    stats = pstats.Stats(profiles[0], stream=out)
+    for profile in profiles[1:]:
+        stats.add(profile)
+    stats.strip_dirs().sort_stats(sort).print_stats(limit)
+    return out.getvalue()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(port=METRICS_PORT, host="127.0.0.1"):
+    # Starts /metrics on a daemon thread; does nothing unless a port is configured
+    if not port:
+        return None
+    server = ThreadingHTTPServer((host, int(port)), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    print(f"Serving metrics on http://{host}:{port}/metrics")
+    return server
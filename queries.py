@@ -0,0 +1,400 @@
+import os
+import time
+from datetime import datetime
+
+import archive_scan
+import columnar
+import downsample
+from changelog import OwnershipLog
+from intel_store import IntelStore
+from score_history import ScoreHistory
+from snapshot_store import SnapshotStore
+from spatial_index import CityIndex
+from world_stats import WorldStats
+
+# Query layer behind the bot's commands. Everything here takes and returns
+# plain data (no Discord objects), so it can be cached, benchmarked or
+# called from a CLI or dashboard.
+
+# Latest snapshots stay loaded between queries
+store = SnapshotStore()
+
+# City ownership changes and player scores recorded by get_data
+ownership_log = OwnershipLog()
+score_history = ScoreHistory()
+
+# Alliance, monument and player totals materialized per WorldData snapshot
+world_stats = WorldStats()
+
+# City intel added by officers
+intel_store = IntelStore()
+
+# Alliance ID to name mapping
+ALLIANCE_NAMES = {
+    "0": "Dragon Fire",
+    "1": "Dragon Claw",
+    "2": "Demons",
+    "3": "Free Time Fun",
+    "4": "44444",
+    "5": "55555",
+    "6": "Zible Believers",
+    # Add more alliances as needed
+}
+
+
+def alliance_name(alliance_id, default=None):
+    return ALLIANCE_NAMES.get(
+        str(alliance_id), default if default is not None else f"Alliance {alliance_id}"
+    )
+
+
+def snapshot_id(dataset):
+    # Identifies the latest data a query result was computed from
+    try:
+        return store.latest_path(dataset)
+    except FileNotFoundError:
+        return None
+
+
+def current_stats():
+    # Materialized stats, only if they are of the newest WorldData snapshot;
+    # when ingest lagged or failed, callers compute from the snapshot instead
+    stats = world_stats.latest()
+    if stats is None:
+        return None
+    try:
+        captured_at = os.path.getmtime(store.latest_path("WorldData"))
+    except FileNotFoundError:
+        return stats
+    return stats if stats.time == captured_at else None
+
+
+def locate_city(x, y):
+    # (continent, owner name) of the city at x, y in the latest snapshot
+    city_index = store.derive("WorldData", CityIndex)
+    city, cont_id = city_index.at(x, y)
+    if city is None:
+        return None, None
+    owner_guid = city["playerGuid"]
+    for player in store.players():
+        if player.get("playerGuid") == owner_guid:
+            return cont_id, player.get("username", owner_guid)
+    return cont_id, owner_guid
+
+
+def add_intel(x, y, message, added_by):
+    try:
+        continent, owner = locate_city(x, y)
+    except FileNotFoundError:
+        continent, owner = None, None
+    return intel_store.add(x, y, message, added_by, continent=continent, owner=owner)
+
+
+def intel_at(x, y):
+    return intel_store.at(x, y)
+
+
+def delete_intel(x, y, deleted_by):
+    return intel_store.delete(x, y, deleted_by)
+
+
+def search_intel(field, value):
+    # Give older entries a continent/owner before filtering on them
+    if field in ("continent", "owner"):
+        try:
+            intel_store.fill_missing(locate_city)
+        except FileNotFoundError:
+            pass
+    return intel_store.search(**{field: value})
+
+
+def _intel_rows(entries):
+    # Load the latest world and player data
+    latest_world_data = store.latest("WorldData")
+    players = store.players()
+
+    # Create a dictionary to map playerGuid to username
+    player_guid_to_name = {
+        player["playerGuid"]: player["username"]
+        for player in players
+        if "playerGuid" in player and "username" in player
+    }
+
+    # Create dictionaries to map coordinates to city owner and continent
+    city_owner_map = {}
+    city_continent_map = {}
+    for continent in latest_world_data["continents"]:
+        cont_id = continent["continentIdentifier"]  # Get the continent ID
+        for city in continent["cities"]:
+            coords = (city["locationX"], city["locationY"])
+            owner_guid = city["playerGuid"]
+            owner_name = player_guid_to_name.get(owner_guid, owner_guid)
+            city_owner_map[coords] = owner_name
+            city_continent_map[coords] = cont_id  # Store just the continent ID
+
+    # Yield rows, using the current owner where the city still exists
+    for entry in entries:
+        coords = (entry["x"], entry["y"])
+        yield [
+            entry["x"],
+            entry["y"],
+            f"({entry['x']}:{entry['y']})",
+            city_continent_map.get(coords, entry["continent"] or "Unknown"),
+            city_owner_map.get(coords, entry["owner"] or "Unknown"),
+            entry["message"],
+            entry["added_on"],
+            entry["added_by"],
+        ]
+
+
+def intel_rows():
+    # Rows for every active entry (generated lazily), or None without intel
+    entries = intel_store.all()
+    if not entries:
+        return None
+    return _intel_rows(entries)
+
+
+def monument_counts(cont_id=None):
+    # {monument type: count} on one continent or the whole world. Counted
+    # once at ingest; counted live when the stats are missing or behind
+    stats = current_stats()
+    if stats is not None:
+        counts = stats.monument_counts(cont_id)
+    else:
+        counts = columnar.monument_counts(store.world_table(), cont_id)
+    return {monument_type: int(count) for monument_type, count in enumerate(counts)}
+
+
+def flipped_cities(days):
+    # Ownership changes are logged at ingest; read the window from the log
+    since = time.time() - float(days) * 24 * 60 * 60
+    oldest = store.oldest_time("WorldData")
+    if oldest is None or oldest > since:
+        return None
+    changes = ownership_log.net_changes_since(since)
+
+    # Create dictionaries to map playerGuid to username and alliance
+    player_guid_to_name = {}
+    player_guid_to_alliance = {}
+    for player in store.players():
+        if "playerGuid" in player and "username" in player:
+            player_guid_to_name[player["playerGuid"]] = player["username"]
+            player_guid_to_alliance[player["playerGuid"]] = player.get(
+                "allianceId", -1
+            )
+
+    flipped = []
+    for change in changes:
+        old_alliance_id = player_guid_to_alliance.get(change["oldOwner"], -1)
+        new_alliance_id = player_guid_to_alliance.get(change["newOwner"], -1)
+        flipped.append(
+            {
+                "name": change["name"],
+                "continent": change["continent"],
+                "coords": f"({change['x']}, {change['y']})",
+                "old_owner": player_guid_to_name.get(
+                    change["oldOwner"], change["oldOwner"]
+                ),
+                "new_owner": player_guid_to_name.get(
+                    change["newOwner"], change["newOwner"]
+                ),
+                "old_alliance": alliance_name(old_alliance_id, "Unknown Alliance"),
+                "new_alliance": alliance_name(new_alliance_id, "Unknown Alliance"),
+            }
+        )
+
+    return flipped
+
+
+def player_scores(player_names, days):
+    since = time.time() - days * 24 * 60 * 60
+    series = score_history.series(player_names, since=since)
+
+    scores_by_name = {}
+    for name in player_names:
+        times, scores = series.get(name, ([], []))
+        # Long windows have hundreds of hourly points; keep the line's shape
+        times, scores = downsample.lttb(times, scores)
+        scores_by_name[name] = (
+            [datetime.fromtimestamp(t) for t in times],
+            [int(score) for score in scores],
+        )
+    return scores_by_name
+
+
+def alliance_trend(continent, days, control=False, top=5):
+    since = time.time() - days * 24 * 60 * 60
+    if control:
+        series = world_stats.continent_control(continent, since=since)
+    else:
+        series = world_stats.alliance_series(continent, "score", since=since)
+
+    # The alliances leading at the end of the window, downsampled for plotting
+    ranked = sorted(series.items(), key=lambda item: item[1][1][-1], reverse=True)[:top]
+    trend = {}
+    for alliance_id, (times, values) in ranked:
+        if control:
+            times, values = downsample.bucket_average(times, values)
+        else:
+            times, values = downsample.lttb(times, values)
+        trend[alliance_name(alliance_id)] = (
+            [datetime.fromtimestamp(t) for t in times],
+            values.tolist(),
+        )
+    return trend
+
+
+def alliance_scores(continent=None, top=5):
+    # [(alliance name, total score, members)], highest score first
+    stats = current_stats()
+    if stats is not None:
+        alliance_totals = stats.alliance_totals(continent)
+    else:
+        # Nothing materialized for this snapshot; compute from the latest ones
+        players = store.players()
+        if not players:
+            return None
+        alliance_totals = columnar.alliance_totals(store.world_table(), players, continent)
+
+    # Sort alliances by total score and keep the top ones
+    sorted_alliances = sorted(
+        alliance_totals.items(), key=lambda x: x[1][0], reverse=True
+    )[:top]
+
+    return [
+        (alliance_name(alliance_id), total_score, member_count)
+        for alliance_id, (total_score, member_count) in sorted_alliances
+    ]
+
+
+def castles_near(xcoord, ycoord):
+    # Castles of the alliance holding the city at x, y on its continent,
+    # nearest first; returns (continent id, rows)
+    players = store.players()
+
+    # Create player_alliance_dict and player_name_dict
+    if not players:
+        return None, None
+
+    player_alliance_dict = {
+        player["playerGuid"]: str(player.get("allianceId", -1))
+        for player in players
+    }
+    
+    player_name_dict = {
+        player["playerGuid"]: player["username"]
+        for player in players
+    }
+
+    # Total score for each player, materialized at ingest when current
+    stats = current_stats()
+    if stats is not None:
+        player_total_score = stats.players
+    else:
+        world_table = store.world_table()
+        player_total_score = dict(
+            zip(world_table.player_guids, columnar.player_totals(world_table).tolist())
+        )
+
+    # Find the continent and alliance of the given coordinates
+    city_index = store.derive("WorldData", CityIndex)
+    target_city, target_continent = city_index.at(xcoord, ycoord)
+    target_alliance = None
+    if target_city is not None:
+        target_alliance = player_alliance_dict.get(target_city["playerGuid"])
+
+    if target_city is None or not target_alliance:
+        return None, []
+
+    castles = []
+    for city_data in city_index.continent(target_continent):
+        if (
+            city_data["isCastle"]
+            and player_alliance_dict.get(city_data["playerGuid"]) == target_alliance
+        ):
+            player_guid = city_data["playerGuid"]
+            distance = (
+                (city_data["locationX"] - xcoord) ** 2
+                + (city_data["locationY"] - ycoord) ** 2
+            ) ** 0.5
+            
+            # Determine special features
+            features = []
+            if city_data.get("hasMonument", False):
+                monument_type = city_data.get("monumentType", "Unknown")
+                features.append(f"Monument Type {monument_type}")
+            if city_data.get("isWaterCity", False):
+                features.append("Water Castle")
+            
+            features_str = ", ".join(features) if features else ""
+            
+            castles.append(
+                [
+                    city_data["locationX"],
+                    city_data["locationY"],
+                    f"({city_data['locationX']}:{city_data['locationY']})",
+                    target_continent,
+                    city_data["name"],
+                    player_name_dict.get(player_guid, "Unknown"),
+                    city_data["score"],
+                    player_total_score.get(player_guid, 0),
+                    round(distance, 2),
+                    features_str
+                ]
+            )
+
+    # Sort castles by distance
+    castles.sort(key=lambda x: x[8])
+
+    return target_continent, castles
+
+
+def altar_surroundings(x, y, radius):
+    # Load the latest city index
+    city_index = store.derive("WorldData", CityIndex)
+
+    # Create dictionaries to map playerGuid to alliance
+    player_guid_to_alliance = {}
+    for player in store.players():
+        if "playerGuid" in player and "allianceId" in player:
+            player_guid_to_alliance[player["playerGuid"]] = alliance_name(
+                player["allianceId"], "Unknown"
+            )
+
+    # Find the continent of the given coordinates
+    city, target_continent = city_index.at(x, y)
+    if city is None:
+        return None
+
+    # Generate surroundings data (only cities and castles), nearest first
+    surroundings_data = []
+    for distance, city, cont_id in city_index.within(
+        x, y, radius, continent=target_continent
+    ):
+        tile_type = "Castle" if city["isCastle"] else "City"
+        alliance = player_guid_to_alliance.get(city["playerGuid"], "Unknown")
+        surroundings_data.append(
+            [
+                city["locationX"],
+                city["locationY"],
+                tile_type,
+                city["name"],
+                alliance,
+                round(distance, 2),
+            ]
+        )
+
+    return surroundings_data
+
+
+def continent_openings():
+    # {continent id: (timestamp, file name)}; the scan stops once every
+    # continent with cities in the latest snapshot has been seen
+    world_table = store.world_table()
+    counts = columnar.continent_city_counts(world_table)
+    expected = {str(cont_id) for cont_id, count in zip(world_table.continents, counts) if count}
+    return archive_scan.continent_openings(
+        [f"{archive_scan.OLD_DATA_DIR}/WorldData", f"{store.data_dir}/WorldData"],
+        expected=expected,
+    )
@@ -0,0 +1,197 @@
+import heapq
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+# Field ranges for "minute hour day-of-month month day-of-week"
+CRON_FIELDS = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 6)]
+
+
+def _parse_field(field, low, high):
+    values = set()
+    for part in field.split(","):
+        step = 1
+        if "/" in part:
+            part, step = part.split("/")
+            step = int(step)
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            start, end = (int(v) for v in part.split("-"))
+        else:
+            start = int(part)
+            end = high if step > 1 else start
+        if start < low or end > high or start > end or step < 1:
+            raise ValueError(f"Invalid cron field '{field}'")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronSchedule:
+    # Standard 5-field cron; day-of-week 0 is Sunday
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Expected 5 cron fields, got '{expression}'")
+        self.expression = expression
+        parsed = [_parse_field(f, low, high) for f, (low, high) in zip(fields, CRON_FIELDS)]
+        self.minutes, self.hours, self.days, self.months, self.weekdays = parsed
+        self._any_day = fields[2] == "*"
+        self._any_weekday = fields[4] == "*"
+        self._sorted_hours = sorted(self.hours)
+        self._sorted_minutes = sorted(self.minutes)
+
+    def __repr__(self):
+        return f"CronSchedule('{self.expression}')"
+
+    def _day_matches(self, day):
+        if day.month not in self.months:
+            return False
+        day_ok = day.day in self.days
+        weekday_ok = (day.weekday() + 1) % 7 in self.weekdays
+        # Like cron: when both are restricted, either one matching is enough
+        if self._any_day:
+            return weekday_ok
+        if self._any_weekday:
+            return day_ok
+        return day_ok or weekday_ok
+
+    def next_after(self, after):
+        # First matching minute strictly after `after` (a naive local datetime)
+        start = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        day = start.replace(hour=0, minute=0)
+        for _ in range(366 * 5):
+            if self._day_matches(day):
+                for hour in self._sorted_hours:
+                    for minute in self._sorted_minutes:
+                        candidate = day.replace(hour=hour, minute=minute)
+                        if candidate >= start:
+                            return candidate
+            day += timedelta(days=1)
+        raise ValueError(f"{self} never fires")
+
+
+class Job:
+    def __init__(self, name, schedule, func, jitter=0, catch_up=True, lock=None):
+        self.name = name
+        self.schedule = schedule if isinstance(schedule, CronSchedule) else CronSchedule(schedule)
+        self.func = func
+        self.jitter = jitter
+        # Run once on start-up if a scheduled time passed while we were down
+        self.catch_up = catch_up
+        # Jobs sharing a lock never run at the same time
+        self.lock = lock
+        self.running = False
+        self.last_run = None
+
+
+class Scheduler:
+    def __init__(self, jobs, max_workers=2, state_file=None):
+        self.jobs = {job.name: job for job in jobs}
+        self.state_file = state_file
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._stop = threading.Event()
+        self._state_lock = threading.Lock()
+        self._queue = []  # (run at, sequence, job name)
+        self._sequence = 0
+        self._started = False
+
+    def _load_state(self):
+        if not self.state_file:
+            return {}
+        try:
+            with open(self.state_file, "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save_state(self):
+        if not self.state_file:
+            return
+        with self._state_lock:
+            state = {name: job.last_run for name, job in self.jobs.items() if job.last_run}
+            tmp_file = f"{self.state_file}.tmp"
+            with open(tmp_file, "w") as f:
+                json.dump(state, f, indent=4)
+            os.replace(tmp_file, self.state_file)
+
+    def _push(self, run_at, job):
+        self._sequence += 1
+        heapq.heappush(self._queue, (run_at, self._sequence, job.name))
+
+    def _schedule_next(self, job, after):
+        fire = job.schedule.next_after(datetime.fromtimestamp(after)).timestamp()
+        self._push(fire + random.uniform(0, job.jitter), job)
+
+    def _run(self, job):
+        try:
+            if job.lock is not None:
+                with job.lock:
+                    job.func()
+            else:
+                job.func()
+            # Only successful runs count, so a failed window is caught up
+            # after a restart
+            job.last_run = time.time()
+        except Exception as e:
+            print(f"Job {job.name} failed: {e}")
+        finally:
+            job.running = False
+            self._save_state()
+
+    def _submit(self, job):
+        if job.running:
+            # Previous run is still going; coalesce instead of stacking up
+            print(f"Skipping {job.name}: previous run still in progress")
+            return
+        job.running = True
+        print(f"Running {job.name} at {datetime.now():%Y-%m-%d %H:%M:%S}")
+        self._pool.submit(self._run, job)
+
+    def start(self):
+        if self._started:
+            return
+        self._started = True
+        now = time.time()
+        state = self._load_state()
+        for job in self.jobs.values():
+            job.last_run = state.get(job.name)
+            if job.catch_up and job.last_run is not None:
+                missed = job.schedule.next_after(datetime.fromtimestamp(job.last_run))
+                if missed.timestamp() <= now:
+                    print(f"Catching up on {job.name}, missed run at {missed}")
+                    self._push(now, job)
+                    continue
+            self._schedule_next(job, now)
+
+    def run_forever(self):
+        self.start()
+        try:
+            while not self._stop.is_set():
+                run_at, _, name = self._queue[0]
+                delay = run_at - time.time()
+                if delay > 0:
+                    # Sleep straight through to the next run; stop() wakes us
+                    self._stop.wait(delay)
+                    continue
+
+                heapq.heappop(self._queue)
+                job = self.jobs[name]
+                self._submit(job)
+                # Scheduling from "now" coalesces any runs missed while late
+                self._schedule_next(job, max(run_at, time.time()))
+        finally:
+            self._pool.shutdown(wait=True)
+
+    def stop(self):
+        self._stop.set()
+
+    def upcoming(self):
+        return [
+            (name, datetime.fromtimestamp(run_at))
+            for run_at, _, name in sorted(self._queue)
+        ]
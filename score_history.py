@@ -0,0 +1,159 @@
+import argparse
+import os
+import sqlite3
+import threading
+
+from snapshot_archive import SnapshotArchive, is_archive
+from snapshot_store import DATA_DIR, SnapshotStore, get_players
+
+# Player score time series, appended to as PlayerData snapshots come in
+SCORES_DB = f"{DATA_DIR}/player_scores.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS players (
+    guid TEXT PRIMARY KEY,
+    username TEXT NOT NULL,
+    username_lower TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS players_username ON players (username_lower);
+CREATE TABLE IF NOT EXISTS scores (
+    guid TEXT NOT NULL,
+    time REAL NOT NULL,
+    score INTEGER NOT NULL,
+    PRIMARY KEY (guid, time)
+) WITHOUT ROWID;
+"""
+
+
+def connect(db_file=SCORES_DB):
+    # For ingest and rebuild; creates the schema
+    os.makedirs(os.path.dirname(db_file) or ".", exist_ok=True)
+    conn = sqlite3.connect(db_file, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+TABLES = ("players", "scores")
+
+
+def swap_in(db_file, rebuilt_file):
+    # Replace every table's rows with the rebuilt ones in one transaction, so
+    # a running bot sees either the old history or the new, never a partial one
+    conn = connect(db_file)
+    try:
+        conn.execute("ATTACH DATABASE ? AS rebuilt", (rebuilt_file,))
+        with conn:
+            for table in TABLES:
+                conn.execute(f"DELETE FROM {table}")
+                conn.execute(f"INSERT INTO {table} SELECT * FROM rebuilt.{table}")
+        conn.execute("DETACH DATABASE rebuilt")
+    finally:
+        conn.close()
+    os.remove(rebuilt_file)
+
+
+def record_player_scores(players, captured_at, db_file=SCORES_DB):
+    # players is a list of (playerGuid, username, score)
+    conn = connect(db_file)
+    try:
+        with conn:
+            conn.executemany(
+                "INSERT INTO players (guid, username, username_lower) VALUES (?, ?, ?) "
+                "ON CONFLICT (guid) DO UPDATE SET "
+                "username = excluded.username, username_lower = excluded.username_lower",
+                [(guid, name, name.lower()) for guid, name, _ in players],
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO scores (guid, time, score) VALUES (?, ?, ?)",
+                [(guid, captured_at, score) for guid, _, score in players],
+            )
+    finally:
+        conn.close()
+
+
+def players_from_snapshot(player_data):
+    return [
+        (p["playerGuid"], p["username"], p.get("score") or 0)
+        for p in get_players(player_data)
+        if "playerGuid" in p and "username" in p
+    ]
+
+
+def players_from_archive(path):
+    # Only the three columns we need, not the raw player JSON
+    with SnapshotArchive(path) as archive:
+        columns = archive.read_columns(["playerGuid", "username", "score"])
+    return list(
+        zip(columns["playerGuid"], columns["username"], columns["score"].tolist())
+    )
+
+
+class ScoreHistory:
+    def __init__(self, db_file=SCORES_DB):
+        self.db_file = db_file
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    def _connection(self):
+        # One plain connection per worker thread, kept open; only the first
+        # in the process creates the schema
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            with self._schema_lock:
+                if not self._schema_ready:
+                    connect(self.db_file).close()
+                    self._schema_ready = True
+            conn = self._local.conn = sqlite3.connect(self.db_file, timeout=30)
+        return conn
+
+    def series(self, usernames, since=None, until=None):
+        # {lowercased username: (times, scores)} for the names that exist
+        conn = self._connection()
+        result = {}
+        for name in usernames:
+            row = conn.execute(
+                "SELECT guid FROM players WHERE username_lower = ?", (name.lower(),)
+            ).fetchone()
+            if row is None:
+                continue
+            rows = conn.execute(
+                "SELECT time, score FROM scores WHERE guid = ? AND time >= ? AND time <= ? "
+                "ORDER BY time",
+                (
+                    row[0],
+                    since if since is not None else float("-inf"),
+                    until if until is not None else float("inf"),
+                ),
+            ).fetchall()
+            result[name.lower()] = ([t for t, _ in rows], [s for _, s in rows])
+        return result
+
+
+def rebuild(data_dir=DATA_DIR):
+    db_file = f"{data_dir}/player_scores.db"
+    # Built beside the live database and swapped in at the end
+    rebuilt_file = f"{db_file}.rebuild"
+    if os.path.exists(rebuilt_file):
+        os.remove(rebuilt_file)
+    connect(rebuilt_file).close()
+
+    store = SnapshotStore(data_dir, history_size=1)
+    files = list(reversed(store.files("PlayerData")))
+    for path in files:
+        if is_archive(path):
+            players = players_from_archive(path)
+        else:
+            players = players_from_snapshot(store.load(path))
+        record_player_scores(players, os.path.getmtime(path), rebuilt_file)
+    swap_in(db_file, rebuilt_file)
+    print(f"Recorded scores from {len(files)} snapshots")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Player score history")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("data_dir", nargs="?", default=DATA_DIR)
+    args = parser.parse_args()
+    rebuild(args.data_dir)
@@ -0,0 +1,314 @@
+import argparse
+import json
+import mmap
+import os
+import pickle
+import shutil
+import struct
+import time
+import zlib
+
+import numpy as np
+
+from columnar import WorldTable, build_world_table
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# File layout: MAGIC, uint32 header length, JSON header, column blobs.
+# The header maps each column to its offset/length in the blob section,
+# so a reader can pull out e.g. just "player" and "score".
+MAGIC = b"ZSNAP1\0\0"
+ARCHIVE_SUFFIX = ".zsnap"
+DEFAULT_CODEC = "zstd" if zstandard is not None else "zlib"
+
+WORLD_ARRAYS = [
+    "x",
+    "y",
+    "score",
+    "monument_type",
+    "has_monument",
+    "is_castle",
+    "is_water",
+    "continent",
+    "player",
+]
+WORLD_STRINGS = ["continents", "player_guids", "names", "city_guids"]
+
+
+def is_archive(path):
+    return path.endswith(ARCHIVE_SUFFIX)
+
+
+def _compress(codec, payload):
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=10).compress(payload)
+    if codec == "zlib":
+        return zlib.compress(payload, 6)
+    return bytes(payload)
+
+
+def _decompress(codec, payload):
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("This archive needs the 'zstandard' package")
+        return zstandard.ZstdDecompressor().decompress(payload)
+    if codec == "zlib":
+        return zlib.decompress(payload)
+    return payload
+
+
+def _world_columns(world_data):
+    # Error payloads from the API have no continents; those are kept raw-only
+    if not isinstance(world_data, dict) or "continents" not in world_data:
+        return {}
+    table = build_world_table(world_data)
+    columns = {name: getattr(table, name) for name in WORLD_ARRAYS}
+    columns.update({name: getattr(table, name) for name in WORLD_STRINGS})
+    return columns
+
+
+def _player_columns(player_data):
+    # Imported here to avoid a cycle with snapshot_store
+    from snapshot_store import get_players
+
+    players = get_players(player_data)
+    return {
+        "playerGuid": [p.get("playerGuid") for p in players],
+        "username": [p.get("username", "") for p in players],
+        "allianceId": np.array([p.get("allianceId", -1) for p in players], dtype=np.int32),
+        "score": np.array([p.get("score", 0) for p in players], dtype=np.int64),
+        "cityCount": np.array([p.get("cityCount", 0) for p in players], dtype=np.int32),
+    }
+
+
+# Typed columns extracted per dataset; everything also keeps a "raw" column
+COLUMN_BUILDERS = {
+    "WorldData": _world_columns,
+    "PlayerData": _player_columns,
+}
+
+
+def write_archive(path, dataset, data, captured_at=None, codec=DEFAULT_CODEC):
+    columns = {}
+    builder = COLUMN_BUILDERS.get(dataset)
+    if builder is not None and isinstance(data, (dict, list)):
+        try:
+            columns.update(builder(data))
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            # An unexpected payload is still saved, just without columns
+            print(f"Saving {path} without columns: {e!r}")
+    # The JSON is kept as well: the archive is the only copy of the data, and
+    # city and player details outside the columns are read from it
+    columns["raw"] = data
+
+    header = {
+        "dataset": dataset,
+        "captured_at": captured_at if captured_at is not None else time.time(),
+        "codec": codec,
+        "columns": {},
+    }
+    blobs = []
+    offset = 0
+    for name, value in columns.items():
+        if isinstance(value, np.ndarray):
+            meta = {"kind": "array", "dtype": value.dtype.str, "shape": list(value.shape)}
+            payload = np.ascontiguousarray(value).tobytes()
+        elif name == "raw":
+            meta = {"kind": "json"}
+            payload = json.dumps(value, separators=(",", ":")).encode("utf-8")
+        else:
+            meta = {"kind": "strings"}
+            payload = json.dumps(list(value), separators=(",", ":")).encode("utf-8")
+
+        blob = _compress(codec, payload)
+        meta.update({"offset": offset, "length": len(blob), "size": len(payload)})
+        header["columns"][name] = meta
+        blobs.append(blob)
+        offset += len(blob)
+
+    header_bytes = json.dumps(header).encode("utf-8")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    # Write to a temporary name so readers never see a half-written file
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as fp:
+        fp.write(MAGIC)
+        fp.write(struct.pack("<I", len(header_bytes)))
+        fp.write(header_bytes)
+        for blob in blobs:
+            fp.write(blob)
+    os.replace(tmp_path, path)
+    return path
+
+
+class SnapshotArchive:
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as fp:
+            self._mmap = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._mmap[: len(MAGIC)] != MAGIC:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a snapshot archive")
+        header_start = len(MAGIC) + 4
+        (header_len,) = struct.unpack("<I", self._mmap[len(MAGIC) : header_start])
+        self.header = json.loads(self._mmap[header_start : header_start + header_len])
+        self._data_start = header_start + header_len
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        try:
+            self._mmap.close()
+        except BufferError:
+            # Arrays still view the map; it is released once they are gone
+            pass
+
+    @property
+    def dataset(self):
+        return self.header["dataset"]
+
+    @property
+    def captured_at(self):
+        return self.header["captured_at"]
+
+    @property
+    def columns(self):
+        return list(self.header["columns"])
+
+    def read(self, name):
+        meta = self.header["columns"][name]
+        start = self._data_start + meta["offset"]
+        codec = self.header["codec"]
+
+        if meta["kind"] == "array" and codec == "none":
+            # Uncompressed arrays are views straight onto the memory map
+            count = meta["size"] // np.dtype(meta["dtype"]).itemsize
+            return np.frombuffer(
+                self._mmap, dtype=meta["dtype"], count=count, offset=start
+            ).reshape(meta["shape"])
+
+        payload = memoryview(self._mmap)[start : start + meta["length"]]
+        try:
+            raw = _decompress(codec, payload)
+            if meta["kind"] == "array":
+                return np.frombuffer(raw, dtype=meta["dtype"]).reshape(meta["shape"])
+            return json.loads(bytes(raw))
+        finally:
+            payload.release()
+
+    def read_columns(self, names):
+        return {name: self.read(name) for name in names}
+
+    def data(self):
+        return self.read("raw")
+
+    def world_table(self):
+        if "x" not in self.header["columns"]:
+            raise ValueError(f"{self.path} has no world columns")
+        columns = self.read_columns(WORLD_ARRAYS + WORLD_STRINGS)
+        return WorldTable(**columns)
+
+
+def read_archive(path):
+    with SnapshotArchive(path) as archive:
+        return archive.data()
+
+
+def _load_legacy(path):
+    with open(path, "rb") as fp:
+        data = pickle.load(fp)
+    # Some early snapshots pickled the JSON text instead of the parsed object
+    if isinstance(data, str):
+        data = json.loads(data)
+    return data
+
+
+def convert_archive(data_dir, delete=False, codec=DEFAULT_CODEC, legacy_dir=None):
+    # One-shot conversion of the pickled archive, oldest files first. Once an
+    # archive reads back the same as its pickle, the pickle is moved out of
+    # data_dir (or removed with delete), so every snapshot is listed once.
+    # Running it again also retires pickles left by earlier conversions.
+    legacy_dir = legacy_dir or os.path.normpath(data_dir) + ".pickles"
+    converted = 0
+    retired = 0
+    saved = 0
+    for dataset in sorted(os.listdir(data_dir)):
+        folder = os.path.join(data_dir, dataset)
+        if not os.path.isdir(folder):
+            continue
+
+        paths = [
+            os.path.join(folder, name)
+            for name in os.listdir(folder)
+            if not name.endswith((ARCHIVE_SUFFIX, ".tmp"))
+        ]
+        paths.sort(key=os.path.getmtime)
+        for path in paths:
+            target = path + ARCHIVE_SUFFIX
+            try:
+                if os.path.exists(target):
+                    read_archive(target)
+                else:
+                    data = _load_legacy(path)
+                    stat = os.stat(path)
+                    write_archive(target, dataset, data, captured_at=stat.st_mtime, codec=codec)
+                    # Keep the original capture time on the new file
+                    os.utime(target, (stat.st_atime, stat.st_mtime))
+                    if read_archive(target) != data:
+                        os.remove(target)
+                        raise ValueError("archive doesn't match the original")
+                    saved += stat.st_size - os.path.getsize(target)
+                    converted += 1
+            except Exception as e:
+                print(f"Skipping {path}: {e}")
+                continue
+
+            if delete:
+                os.remove(path)
+            else:
+                os.makedirs(os.path.join(legacy_dir, dataset), exist_ok=True)
+                shutil.move(path, os.path.join(legacy_dir, dataset, os.path.basename(path)))
+            retired += 1
+
+    print(f"Converted {converted} snapshots, saved {saved / 1024 / 1024:.1f} MB")
+    if delete:
+        print(f"Removed {retired} pickles")
+    else:
+        print(f"Moved {retired} pickles to {legacy_dir}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Zalenia snapshot archive tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    convert = subparsers.add_parser("convert", help="Convert pickled snapshots")
+    convert.add_argument("data_dir", nargs="?", default="D:/ZaleniaData")
+    convert.add_argument("--delete", action="store_true", help="Remove the pickles")
+    convert.add_argument("--legacy-dir", help="where pickles are moved, default <data_dir>.pickles")
+    convert.add_argument("--codec", default=DEFAULT_CODEC, choices=["zstd", "zlib", "none"])
+
+    info = subparsers.add_parser("info", help="Show an archive's columns")
+    info.add_argument("path")
+
+    args = parser.parse_args()
+    if args.command == "convert":
+        convert_archive(
+            args.data_dir, delete=args.delete, codec=args.codec, legacy_dir=args.legacy_dir
+        )
+    elif args.command == "info":
+        with SnapshotArchive(args.path) as archive:
+            print(f"{archive.dataset} captured {time.ctime(archive.captured_at)}")
+            for name, meta in archive.header["columns"].items():
+                print(f"  {name}: {meta['kind']} {meta['length']:,} bytes ({meta['size']:,} raw)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+import glob
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import perf
+from columnar import build_world_table
+from manifest import Manifest
+from snapshot_archive import SnapshotArchive, is_archive, read_archive
+
+# Player fields stored as archive columns
+PLAYER_COLUMNS = ["playerGuid", "username", "allianceId", "score", "cityCount"]
+
+# Overridable so the bot and tools can run against another data folder
+DATA_DIR = os.getenv("ZALENIA_DATA_DIR", "D:/ZaleniaData")
+
+
+def get_players(player_data):
+    # PlayerData snapshots are either a plain list or {"players": [...]}
+    if isinstance(player_data, list):
+        return player_data
+    if isinstance(player_data, dict) and "players" in player_data:
+        return player_data["players"]
+    return []
+
+
+@perf.timed("load")
+def load_snapshot(path):
+    perf.metrics.incr("snapshot_loads_total")
+    if is_archive(path):
+        return read_archive(path)
+    # Snapshots saved before the archive format
+    with open(path, "rb") as fp:
+        return pickle.load(fp)
+
+
+class SnapshotStore:
+    def __init__(self, data_dir=DATA_DIR, history_size=16):
+        self.data_dir = data_dir
+        self.history_size = history_size
+        self.manifest = Manifest(data_dir)
+        self._lock = threading.RLock()
+        # dataset -> (directory mtime, files sorted newest first)
+        self._listings = {}
+        # dataset -> (path, file mtime, data)
+        self._latest = {}
+        # path -> data, least recently used first
+        self._history = OrderedDict()
+        # (dataset, builder) -> (path, built object)
+        self._derived = {}
+
+    def files(self, dataset):
+        # Only re-list the folder when its mtime changes, i.e. a new file landed
+        folder = f"{self.data_dir}/{dataset}"
+        try:
+            folder_mtime = os.stat(folder).st_mtime
+        except FileNotFoundError:
+            return []
+
+        with self._lock:
+            cached = self._listings.get(dataset)
+            if cached and cached[0] == folder_mtime:
+                return cached[1]
+
+            # Sorted by mtime, which the archive converter preserves
+            with perf.span("discover"):
+                files = sorted(
+                    (path for path in glob.glob(f"{folder}/*") if not path.endswith(".tmp")),
+                    key=os.path.getmtime,
+                    reverse=True,
+                )
+            self._listings[dataset] = (folder_mtime, files)
+            return files
+
+    def _indexed(self, dataset):
+        # The manifest can answer for a folder that hasn't changed since its
+        # last record; a snapshot saved or removed without one means listing
+        try:
+            folder_mtime = os.stat(f"{self.data_dir}/{dataset}").st_mtime
+        except FileNotFoundError:
+            return False
+        return self.manifest.folder_mtime(dataset) == folder_mtime
+
+    def latest_path(self, dataset):
+        if self._indexed(dataset):
+            entry = self.manifest.latest(dataset)
+            if entry is not None:
+                return entry.path
+
+        files = self.files(dataset)
+        if not files:
+            raise FileNotFoundError(f"No {dataset} snapshots in {self.data_dir}")
+        return files[0]
+
+    def path_at(self, dataset, time):
+        # Newest snapshot captured at or before time, or None
+        if self._indexed(dataset):
+            entry = self.manifest.at_or_before(dataset, time)
+            if entry is not None:
+                return entry.path
+
+        for path in self.files(dataset):
+            if os.path.getmtime(path) <= time:
+                return path
+        return None
+
+    def oldest_time(self, dataset):
+        # Capture time of the first snapshot, or None when there are none
+        if self._indexed(dataset):
+            entry = self.manifest.oldest(dataset)
+            if entry is not None:
+                return entry.captured_at
+
+        files = self.files(dataset)
+        return os.path.getmtime(files[-1]) if files else None
+
+    def latest(self, dataset):
+        return self._latest_entry(dataset)[1]
+
+    def _latest_entry(self, dataset):
+        path = self.latest_path(dataset)
+        mtime = os.path.getmtime(path)
+
+        with self._lock:
+            cached = self._latest.get(dataset)
+            if cached and cached[0] == path and cached[1] == mtime:
+                return path, cached[2]
+
+            data = load_snapshot(path)
+            self._latest[dataset] = (path, mtime, data)
+            return path, data
+
+    def load(self, path):
+        # Historical snapshots go through a bounded LRU
+        with self._lock:
+            for cached_path, mtime, data in self._latest.values():
+                if cached_path == path:
+                    return data
+
+            if path in self._history:
+                self._history.move_to_end(path)
+                return self._history[path]
+
+            data = load_snapshot(path)
+            self._history[path] = data
+            while len(self._history) > self.history_size:
+                self._history.popitem(last=False)
+            return data
+
+    def derive(self, dataset, builder):
+        # Objects built from the latest snapshot (indexes, tables) are
+        # rebuilt only when that snapshot changes
+        path, data = self._latest_entry(dataset)
+
+        with self._lock:
+            cached = self._derived.get((dataset, builder))
+            if cached and cached[0] == path:
+                return cached[1]
+
+            built = builder(data)
+            self._derived[(dataset, builder)] = (path, built)
+            return built
+
+    def world_table(self):
+        # Archives carry the table's columns, so skip parsing the raw JSON
+        path = self.latest_path("WorldData")
+        if not is_archive(path):
+            return self.derive("WorldData", build_world_table)
+
+        with self._lock:
+            cached = self._derived.get(("WorldData", build_world_table))
+            if cached and cached[0] == path:
+                return cached[1]
+
+            with SnapshotArchive(path) as archive:
+                table = archive.world_table()
+            self._derived[("WorldData", build_world_table)] = (path, table)
+            return table
+
+    def players(self):
+        # Archives carry the player fields the queries use, so skip parsing
+        # the raw JSON (achievements, titles, ...)
+        path = self.latest_path("PlayerData")
+        if not is_archive(path):
+            return get_players(self.latest("PlayerData"))
+
+        with self._lock:
+            cached = self._derived.get(("PlayerData", get_players))
+            if cached and cached[0] == path:
+                return cached[1]
+
+            with SnapshotArchive(path) as archive:
+                if "playerGuid" in archive.columns:
+                    columns = archive.read_columns(PLAYER_COLUMNS)
+                    values = [
+                        column.tolist() if isinstance(column, np.ndarray) else column
+                        for column in columns.values()
+                    ]
+                    players = [dict(zip(PLAYER_COLUMNS, row)) for row in zip(*values)]
+                else:
+                    players = get_players(archive.data())
+            self._derived[("PlayerData", get_players)] = (path, players)
+            return players
+
+    def clear(self):
+        with self._lock:
+            self._listings.clear()
+            self._latest.clear()
+            self._history.clear()
+            self._derived.clear()
@@ -0,0 +1,108 @@
+import heapq
+import math
+
+# Side length of a grid bucket in tiles
+CELL_SIZE = 8
+
+
+class CityIndex:
+    def __init__(self, world_data, cell_size=CELL_SIZE):
+        self.cell_size = cell_size
+        # (x, y) -> (city, continent id)
+        self._by_coords = {}
+        # (cell x, cell y) -> [(city, continent id), ...]
+        self._buckets = {}
+        # continent id -> [city, ...]
+        self._continents = {}
+
+        for cont_data in world_data["continents"]:
+            cont_id = cont_data["continentIdentifier"]
+            self._continents[cont_id] = cont_data["cities"]
+            for city in cont_data["cities"]:
+                x, y = city["locationX"], city["locationY"]
+                entry = (city, cont_id)
+                self._by_coords[(x, y)] = entry
+                cell = (x // cell_size, y // cell_size)
+                self._buckets.setdefault(cell, []).append(entry)
+
+        # Bounding box of occupied buckets, to know when nearest() can stop
+        if self._buckets:
+            cells_x = [cell[0] for cell in self._buckets]
+            cells_y = [cell[1] for cell in self._buckets]
+            self._bounds = (min(cells_x), min(cells_y), max(cells_x), max(cells_y))
+        else:
+            self._bounds = None
+
+    def __len__(self):
+        return len(self._by_coords)
+
+    def at(self, x, y):
+        # Returns (city, continent id) or (None, None)
+        return self._by_coords.get((x, y), (None, None))
+
+    def continent(self, cont_id):
+        return self._continents.get(cont_id, [])
+
+    def within(self, x, y, radius, continent=None):
+        # Cities within radius of (x, y) as (distance, city, continent id), nearest first
+        size = self.cell_size
+        results = []
+        for cell_x in range((x - radius) // size, (x + radius) // size + 1):
+            for cell_y in range((y - radius) // size, (y + radius) // size + 1):
+                for city, cont_id in self._buckets.get((cell_x, cell_y), ()):
+                    if continent is not None and cont_id != continent:
+                        continue
+                    distance = math.hypot(city["locationX"] - x, city["locationY"] - y)
+                    if distance <= radius:
+                        results.append((distance, city, cont_id))
+        results.sort(key=lambda r: r[0])
+        return results
+
+    def nearest(self, x, y, k=1, continent=None, where=None):
+        # Walk outwards ring by ring until the k-th best can't be beaten
+        size = self.cell_size
+        center_x, center_y = x // size, y // size
+        max_ring = self._max_ring(center_x, center_y)
+        best = []  # max-heap of (-distance, counter, city, continent id)
+        counter = 0
+
+        for ring in range(max_ring + 1):
+            if len(best) == k and -best[0][0] <= (ring - 1) * size:
+                break
+            for cell in self._ring_cells(center_x, center_y, ring):
+                for city, cont_id in self._buckets.get(cell, ()):
+                    if continent is not None and cont_id != continent:
+                        continue
+                    if where is not None and not where(city):
+                        continue
+                    distance = math.hypot(city["locationX"] - x, city["locationY"] - y)
+                    counter += 1
+                    if len(best) < k:
+                        heapq.heappush(best, (-distance, counter, city, cont_id))
+                    elif distance < -best[0][0]:
+                        heapq.heapreplace(best, (-distance, counter, city, cont_id))
+
+        return [(-d, city, cont_id) for d, _, city, cont_id in sorted(best, reverse=True)]
+
+    def _max_ring(self, center_x, center_y):
+        if self._bounds is None:
+            return -1
+        min_x, min_y, max_x, max_y = self._bounds
+        return max(
+            abs(min_x - center_x),
+            abs(max_x - center_x),
+            abs(min_y - center_y),
+            abs(max_y - center_y),
+        )
+
+    @staticmethod
+    def _ring_cells(center_x, center_y, ring):
+        if ring == 0:
+            yield (center_x, center_y)
+            return
+        for dx in range(-ring, ring + 1):
+            yield (center_x + dx, center_y - ring)
+            yield (center_x + dx, center_y + ring)
+        for dy in range(-ring + 1, ring):
+            yield (center_x - ring, center_y + dy)
+            yield (center_x + ring, center_y + dy)
@@ -0,0 +1,78 @@
+import asyncio
+import contextlib
+import contextvars
+import functools
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import perf
+
+# Limits can be tuned per deployment through the environment
+MAX_CONCURRENCY = int(os.getenv("BOT_MAX_CONCURRENCY", "4"))
+PER_COMMAND_CONCURRENCY = int(os.getenv("BOT_PER_COMMAND_CONCURRENCY", "1"))
+THREAD_WORKERS = int(os.getenv("BOT_THREAD_WORKERS", "4"))
+PROCESS_WORKERS = int(os.getenv("BOT_PROCESS_WORKERS", "2"))
+
+
+class WorkPool:
+    def __init__(
+        self,
+        max_concurrency=MAX_CONCURRENCY,
+        per_command=PER_COMMAND_CONCURRENCY,
+        thread_workers=THREAD_WORKERS,
+        process_workers=PROCESS_WORKERS,
+    ):
+        self.max_concurrency = max_concurrency
+        self.per_command = per_command
+        self.process_workers = process_workers
+        self._threads = ThreadPoolExecutor(
+            max_workers=thread_workers, thread_name_prefix="bot-work"
+        )
+        # Started on first use so importing the bot doesn't spawn processes
+        self._processes = None
+        self._total = asyncio.Semaphore(max_concurrency)
+        self._commands = {}
+
+    async def to_thread(self, func, *args, **kwargs):
+        # File I/O and work on snapshots already resident in this process.
+        # The context is copied so spans and profiling know the command.
+        loop = asyncio.get_running_loop()
+        call = functools.partial(perf.timed("compute")(perf.profiled(func)), *args, **kwargs)
+        return await loop.run_in_executor(
+            self._threads, contextvars.copy_context().run, call
+        )
+
+    async def to_process(self, func, *args, **kwargs):
+        # CPU-bound work on small, picklable inputs (e.g. chart rendering)
+        if self._processes is None:
+            self._processes = ProcessPoolExecutor(max_workers=self.process_workers)
+        loop = asyncio.get_running_loop()
+        with perf.span("render"):
+            return await loop.run_in_executor(
+                self._processes, functools.partial(func, *args, **kwargs)
+            )
+
+    @contextlib.asynccontextmanager
+    async def slot(self, name):
+        # Queue behind earlier runs of the same command, then the global limit
+        if name not in self._commands:
+            self._commands[name] = asyncio.Semaphore(self.per_command)
+        async with contextlib.AsyncExitStack() as stack:
+            with perf.span("queue"):
+                await stack.enter_async_context(self._commands[name])
+                await stack.enter_async_context(self._total)
+            yield
+
+    def queued(self, func):
+        # Decorator for command callbacks; keeps the signature discord.py parses
+        @functools.wraps(func)
+        async def wrapper(ctx, *args, **kwargs):
+            async with self.slot(func.__name__):
+                return await func(ctx, *args, **kwargs)
+
+        return wrapper
+
+    def shutdown(self):
+        self._threads.shutdown(wait=False)
+        if self._processes is not None:
+            self._processes.shutdown(wait=False)
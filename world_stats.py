@@ -0,0 +1,311 @@
+import argparse
+import bisect
+import os
+import sqlite3
+import threading
+
+import columnar
+from columnar import build_world_table
+from snapshot_archive import SnapshotArchive, is_archive
+from snapshot_store import DATA_DIR, SnapshotStore, get_players
+
+# Per-snapshot aggregates, materialized as WorldData snapshots come in
+STATS_DB = f"{DATA_DIR}/world_stats.db"
+# Continent key for the whole-world rows
+ALL_CONTINENTS = "*"
+ALLIANCE_COLUMNS = ("score", "members", "castles", "cities")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    time REAL PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS alliance_stats (
+    time REAL NOT NULL,
+    continent TEXT NOT NULL,
+    alliance INTEGER NOT NULL,
+    score INTEGER NOT NULL,
+    members INTEGER NOT NULL,
+    castles INTEGER NOT NULL,
+    cities INTEGER NOT NULL,
+    PRIMARY KEY (time, continent, alliance)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS alliance_stats_alliance ON alliance_stats (alliance, continent, time);
+CREATE TABLE IF NOT EXISTS monument_stats (
+    time REAL NOT NULL,
+    continent TEXT NOT NULL,
+    type INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (time, continent, type)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS player_totals (
+    time REAL NOT NULL,
+    guid TEXT NOT NULL,
+    score INTEGER NOT NULL,
+    PRIMARY KEY (time, guid)
+) WITHOUT ROWID;
+"""
+
+
+def connect(db_file=STATS_DB):
+    # For ingest and rebuild; creates the schema
+    os.makedirs(os.path.dirname(db_file) or ".", exist_ok=True)
+    conn = sqlite3.connect(db_file, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+TABLES = ("snapshots", "alliance_stats", "monument_stats", "player_totals")
+
+
+def swap_in(db_file, rebuilt_file):
+    # Replace every table's rows with the rebuilt ones in one transaction, so
+    # a running bot sees either the old stats or the new, never a partial set
+    conn = connect(db_file)
+    try:
+        conn.execute("ATTACH DATABASE ? AS rebuilt", (rebuilt_file,))
+        with conn:
+            for table in TABLES:
+                conn.execute(f"DELETE FROM {table}")
+                conn.execute(f"INSERT INTO {table} SELECT * FROM rebuilt.{table}")
+        conn.execute("DETACH DATABASE rebuilt")
+    finally:
+        conn.close()
+    os.remove(rebuilt_file)
+
+
+def _continent_key(cont_id):
+    return ALL_CONTINENTS if cont_id is None else str(cont_id)
+
+
+def compute_stats(table, players):
+    # (alliance rows, monument rows, player rows) for one snapshot
+    alliance_rows = [
+        (str(table.continents[cont]), alliance, score, members, castles, cities)
+        for cont, alliance, score, members, castles, cities in columnar.alliance_stats(
+            table, players
+        )
+    ]
+    alliance_rows += [
+        (ALL_CONTINENTS, alliance, score, members, castles, cities)
+        for _, alliance, score, members, castles, cities in columnar.alliance_stats(
+            table, players, by_continent=False
+        )
+    ]
+
+    monument_rows = []
+    for cont_id in [None, *table.continents]:
+        counts = columnar.monument_counts(table, cont_id)
+        monument_rows += [
+            (_continent_key(cont_id), monument_type, int(count))
+            for monument_type, count in enumerate(counts)
+        ]
+
+    player_rows = list(
+        zip(table.player_guids, columnar.player_totals(table).tolist())
+    )
+    return alliance_rows, monument_rows, player_rows
+
+
+def record_world_stats(table, players, captured_at, db_file=STATS_DB):
+    # Called by get_data for every WorldData snapshot it saves; players is
+    # the latest PlayerData list, which supplies the alliances
+    alliance_rows, monument_rows, player_rows = compute_stats(table, players)
+    conn = connect(db_file)
+    try:
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO snapshots (time) VALUES (?)", (captured_at,))
+            for sql in (
+                "DELETE FROM alliance_stats WHERE time = ?",
+                "DELETE FROM monument_stats WHERE time = ?",
+                "DELETE FROM player_totals WHERE time = ?",
+            ):
+                conn.execute(sql, (captured_at,))
+            conn.executemany(
+                "INSERT INTO alliance_stats VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(captured_at, *row) for row in alliance_rows],
+            )
+            conn.executemany(
+                "INSERT INTO monument_stats VALUES (?, ?, ?, ?)",
+                [(captured_at, *row) for row in monument_rows],
+            )
+            conn.executemany(
+                "INSERT INTO player_totals VALUES (?, ?, ?)",
+                [(captured_at, *row) for row in player_rows],
+            )
+    finally:
+        conn.close()
+
+
+class SnapshotStats:
+    # Aggregates of one snapshot, held as plain dictionaries
+    def __init__(self, time, alliance_rows, monument_rows, player_rows):
+        self.time = time
+        # continent -> {allianceId: (score, members, castles, cities)}
+        self.alliances = {}
+        for continent, alliance, score, members, castles, cities in alliance_rows:
+            self.alliances.setdefault(continent, {})[alliance] = (
+                score, members, castles, cities
+            )
+        # continent -> [count per monument type]
+        self.monuments = {}
+        for continent, monument_type, count in monument_rows:
+            counts = self.monuments.setdefault(
+                continent, [0] * columnar.MONUMENT_TYPES
+            )
+            counts[monument_type] = count
+        # playerGuid -> total city score
+        self.players = dict(player_rows)
+
+    def alliance_totals(self, cont_id=None):
+        # Same shape as columnar.alliance_totals: {allianceId: (total, members)}
+        return {
+            alliance: (score, members)
+            for alliance, (score, members, _, _) in self.alliances.get(
+                _continent_key(cont_id), {}
+            ).items()
+        }
+
+    def monument_counts(self, cont_id=None):
+        return self.monuments.get(
+            _continent_key(cont_id), [0] * columnar.MONUMENT_TYPES
+        )
+
+
+class WorldStats:
+    def __init__(self, db_file=STATS_DB):
+        self.db_file = db_file
+        self._lock = threading.Lock()
+        self._latest = None
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    def _connection(self):
+        # One plain connection per worker thread, kept open; only the first
+        # in the process creates the schema
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            with self._schema_lock:
+                if not self._schema_ready:
+                    connect(self.db_file).close()
+                    self._schema_ready = True
+            conn = self._local.conn = sqlite3.connect(self.db_file, timeout=30)
+        return conn
+
+    def times(self):
+        conn = self._connection()
+        return [t for (t,) in conn.execute("SELECT time FROM snapshots ORDER BY time")]
+
+    def at(self, time):
+        conn = self._connection()
+        return SnapshotStats(
+            time,
+            conn.execute(
+                "SELECT continent, alliance, score, members, castles, cities "
+                "FROM alliance_stats WHERE time = ?",
+                (time,),
+            ).fetchall(),
+            conn.execute(
+                "SELECT continent, type, count FROM monument_stats WHERE time = ?",
+                (time,),
+            ).fetchall(),
+            conn.execute(
+                "SELECT guid, score FROM player_totals WHERE time = ?", (time,)
+            ).fetchall(),
+        )
+
+    def latest(self):
+        # Stats of the newest recorded snapshot, or None before the first one;
+        # only reloaded when a newer snapshot has been recorded
+        (time,) = self._connection().execute("SELECT MAX(time) FROM snapshots").fetchone()
+        if time is None:
+            return None
+
+        with self._lock:
+            if self._latest is None or self._latest.time != time:
+                self._latest = self.at(time)
+            return self._latest
+
+    def alliance_series(self, cont_id=None, column="score", since=None, until=None):
+        # {allianceId: (times, values)} of one alliance aggregate over time
+        if column not in ALLIANCE_COLUMNS:
+            raise ValueError(f"Unknown alliance column '{column}'")
+        rows = self._connection().execute(
+            f"SELECT alliance, time, {column} FROM alliance_stats "
+            "WHERE continent = ? AND time >= ? AND time <= ? ORDER BY alliance, time",
+            (
+                _continent_key(cont_id),
+                since if since is not None else float("-inf"),
+                until if until is not None else float("inf"),
+            ),
+        ).fetchall()
+
+        series = {}
+        for alliance, time, value in rows:
+            times, values = series.setdefault(alliance, ([], []))
+            times.append(time)
+            values.append(value)
+        return series
+
+    def continent_control(self, cont_id=None, since=None, until=None):
+        # {allianceId: (times, percent of alliance-held cities)} over time
+        series = self.alliance_series(cont_id, "cities", since, until)
+        totals = {}
+        for times, cities in series.values():
+            for time, count in zip(times, cities):
+                totals[time] = totals.get(time, 0) + count
+        return {
+            alliance: (times, [100 * count / totals[t] for t, count in zip(times, cities)])
+            for alliance, (times, cities) in series.items()
+        }
+
+    def nearest(self, time):
+        # Stats of the newest snapshot at or before time, for comparisons
+        times = self.times()
+        i = bisect.bisect_right(times, time)
+        if not i:
+            return None
+        return self.at(times[i - 1])
+
+
+def _world_table(store, path):
+    if is_archive(path):
+        with SnapshotArchive(path) as archive:
+            return archive.world_table()
+    return build_world_table(store.load(path))
+
+
+def rebuild(data_dir=DATA_DIR):
+    # Recompute every WorldData snapshot, pairing each with the PlayerData
+    # snapshot taken at or just before it
+    db_file = f"{data_dir}/world_stats.db"
+    # Built beside the live database and swapped in at the end
+    rebuilt_file = f"{db_file}.rebuild"
+    if os.path.exists(rebuilt_file):
+        os.remove(rebuilt_file)
+    connect(rebuilt_file).close()
+
+    store = SnapshotStore(data_dir, history_size=1)
+    player_files = list(reversed(store.files("PlayerData")))
+    player_times = [os.path.getmtime(path) for path in player_files]
+    if not player_files:
+        print("No PlayerData snapshots to take alliances from")
+        return
+
+    world_files = list(reversed(store.files("WorldData")))
+    for path in world_files:
+        captured_at = os.path.getmtime(path)
+        i = max(bisect.bisect_right(player_times, captured_at) - 1, 0)
+        players = get_players(store.load(player_files[i]))
+        record_world_stats(_world_table(store, path), players, captured_at, rebuilt_file)
+    swap_in(db_file, rebuilt_file)
+    print(f"Recorded stats for {len(world_files)} snapshots")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-snapshot world aggregates")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("data_dir", nargs="?", default=DATA_DIR)
+    args = parser.parse_args()
+    rebuild(args.data_dir)